@@ -0,0 +1,154 @@
+import asyncio
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from app.parsing import SCHEDULE_BITS, Schedule, normalize_city
+
+
+class SearchFilters(NamedTuple):
+    """
+    Optional attribute filters of a search, every given one must match.
+    Hashable, so it is part of the result cache key.
+
+    Salary and experience are interpreted from the searcher's side:
+    for resumes they are the maximal salary budget and the minimal
+    experience of the candidate, for vacancies the desired salary
+    and the experience of the candidate.
+    """
+
+    city: str | None = None
+    schedule: Schedule | None = None
+    salary: float | None = None
+    experience: float | None = None
+
+    def any(self) -> bool:
+        """Whether any filter is set."""
+        return any(v is not None for v in self)
+
+
+class AttributeStore:
+    """
+    Compact in-memory columnar store of the filterable attributes
+    of resumes or vacancies: one numpy array per attribute, indexed
+    by faiss id. Cities are stored as codes of a shared vocabulary.
+    """
+
+    def __init__(self, type: str) -> None:
+        """
+        :param type: "res" or "vac".
+        """
+        self.type = type
+
+        # Code 0 is the unknown city
+        self.cities = {"": 0}
+        self.size = 0
+        self.columns = self._empty(0)
+
+        # Ids below `synced` were loaded from the database, except `pending`,
+        # which were looked up `attempts` times without finding their rows
+        self.synced = 0
+        self.pending = np.empty(0, dtype="int64")
+        self.attempts = {}
+        self.lock = asyncio.Lock()
+
+    def set(self, ids: np.ndarray, typed: pd.DataFrame) -> None:
+        """
+        Store the attributes of the given rows.
+
+        :param ids: Faiss ids of the rows.
+        :param typed: DataFrame with the typed columns of the rows
+            (see `app.parsing.typed_columns`), missing values as None/NaN.
+        """
+        ids = np.asarray(ids, dtype="int64")
+        if len(ids) == 0:
+            return
+
+        self._grow(int(ids.max()) + 1)
+
+        self.columns["city"][ids] = np.fromiter(
+            (
+                self.cities.setdefault(c or "", len(self.cities))
+                for c in typed["city_norm"]
+            ),
+            dtype="int32",
+            count=len(ids),
+        )
+        self.columns["schedule"][ids] = (
+            typed["schedule_bits"].fillna(0).to_numpy(dtype="uint8")
+        )
+        for name in ("salary_min", "salary_max", "exp_years"):
+            self.columns[name][ids] = typed[name].to_numpy(
+                dtype="float32", na_value=np.nan
+            )
+
+    def mask(self, filters: SearchFilters, n: int) -> np.ndarray:
+        """
+        Evaluate the filters over the first n ids.
+        Rows with unknown values of a filtered attribute never match.
+
+        :param filters: The search filters.
+        :param n: Number of ids (the index size).
+        """
+        self._grow(n)
+        cols = {name: values[:n] for name, values in self.columns.items()}
+
+        mask = np.ones(n, dtype=bool)
+
+        if filters.city is not None:
+            city = normalize_city(pd.Series([filters.city]))[0]
+            mask &= cols["city"] == self.cities.get(city, -1)
+
+        if filters.schedule is not None:
+            mask &= (cols["schedule"] & SCHEDULE_BITS[filters.schedule]) != 0
+
+        # NaN never compares true, so unknown values are excluded
+        if filters.salary is not None:
+            if self.type == "res":
+                mask &= cols["salary_min"] <= filters.salary
+            else:
+                upper = np.where(
+                    np.isnan(cols["salary_max"]), cols["salary_min"], cols["salary_max"]
+                )
+                mask &= upper >= filters.salary
+
+        if filters.experience is not None:
+            if self.type == "res":
+                mask &= cols["exp_years"] >= filters.experience
+            else:
+                mask &= cols["exp_years"] <= filters.experience
+
+        return mask
+
+    def stats(self) -> dict:
+        """Return the store size and memory footprint."""
+        return {
+            "size": self.size,
+            "synced": self.synced,
+            "pending": len(self.pending),
+            "cities": len(self.cities),
+            "bytes": sum(values.nbytes for values in self.columns.values()),
+        }
+
+    @staticmethod
+    def _empty(n: int) -> dict[str, np.ndarray]:
+        return {
+            "city": np.zeros(n, dtype="int32"),
+            "schedule": np.zeros(n, dtype="uint8"),
+            "salary_min": np.full(n, np.nan, dtype="float32"),
+            "salary_max": np.full(n, np.nan, dtype="float32"),
+            "exp_years": np.full(n, np.nan, dtype="float32"),
+        }
+
+    def _grow(self, n: int) -> None:
+        capacity = len(self.columns["city"])
+        if n > capacity:
+            # Grown geometrically, so inserts are amortized O(1)
+            extra = self._empty(max(n, 2 * capacity) - capacity)
+            self.columns = {
+                name: np.concatenate([values, extra[name]])
+                for name, values in self.columns.items()
+            }
+
+        self.size = max(self.size, n)
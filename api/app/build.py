@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import app.config as config
+from app.cache import DocumentEmbeddingCache, content_hash
+from app.indexes import FaissIndex, atomic_write
+from app.parsing import document_texts, typed_columns
+
+
+SOURCES = {
+    "res": (config.path_to_res, config.path_to_res_index),
+    "vac": (config.path_to_vac, config.path_to_vac_index),
+}
+
+
+def metadata_path(type: str) -> str:
+    """
+    Path of the bulk-loadable metadata file of a document type:
+    a CSV file with a header, p_id, the text and the typed columns.
+
+    :param type: "res" or "vac".
+    """
+    return os.path.join(config.build_dir, f"{type}.csv")
+
+
+def state_path(type: str) -> str:
+    """
+    Path of the checkpoint of a document type.
+
+    :param type: "res" or "vac".
+    """
+    return os.path.join(config.build_dir, f"{type}.state.json")
+
+
+def read_state(type: str) -> dict | None:
+    """
+    Read the checkpoint of a document type, None if there is none.
+
+    :param type: "res" or "vac".
+    """
+    try:
+        with open(state_path(type)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_state(type: str, state: dict) -> None:
+    """
+    Atomically write the checkpoint of a document type.
+
+    :param type: "res" or "vac".
+    :param state: Rows done ("ntotal"), the size of the metadata file
+        covering them ("meta_bytes") and whether the build is "done".
+    """
+
+    def write(p):
+        with open(p, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    atomic_write(write, state_path(type))
+
+
+def start_pool(workers: int):
+    """
+    Start the model in worker processes, with the inference pool
+    and configuration of the embedder service (`embedder/pool.py`).
+
+    :param workers: Number of worker processes.
+    """
+    embedder_dir = os.path.abspath(config.build_embedder_dir)
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    # Spawned workers import this module again from the embedder directory
+    sys.path[:0] = [embedder_dir, api_dir]
+    from config import BACKEND, PIN_WORKERS, THREADS_PER_WORKER
+    from embedder_onnx import prepare_backend
+    from pool import InferencePool
+
+    pool = InferencePool(BACKEND, workers, THREADS_PER_WORKER, PIN_WORKERS)
+
+    # The model paths of the embedder config are relative to its directory
+    cwd = os.getcwd()
+    os.chdir(embedder_dir)
+    try:
+        prepare_backend(BACKEND)
+        pool.start()
+    finally:
+        os.chdir(cwd)
+
+    return pool
+
+
+class ChunkEmbedder:
+    """
+    Embeds the texts of a chunk with all the workers of an inference
+    pool at once, skipping the texts found in the document cache.
+    """
+
+    def __init__(self, pool, workers: int, batch_size: int) -> None:
+        """
+        :param pool: A started `InferencePool`.
+        :param workers: Number of its worker processes.
+        :param batch_size: Texts per batch sent to a worker.
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.cache = None
+        if config.document_cache_path:
+            self.cache = DocumentEmbeddingCache(config.document_cache_path)
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed texts, every distinct one once.
+
+        :param texts: The document texts.
+        """
+        keys = [content_hash(text) for text in texts]
+        found = {}
+        if self.cache is not None:
+            found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            computed = dict(zip(missing, self._encode(list(missing.values()))))
+            if self.cache is not None:
+                self.cache.put_many(computed)
+            found |= computed
+
+        return np.vstack([found[key] for key in keys]).astype("float32", copy=False)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        batches = [
+            texts[start : start + self.batch_size]
+            for start in range(0, len(texts), self.batch_size)
+        ]
+
+        return np.vstack(list(self.executor.map(self.pool.encode, batches)))
+
+
+def remove_build(type: str) -> None:
+    """
+    Remove the checkpoint, the metadata and the index files of a type.
+
+    :param type: "res" or "vac".
+    """
+    _, index_path = SOURCES[type]
+    base_path = os.path.splitext(index_path)[0]
+
+    paths = [state_path(type), metadata_path(type), index_path]
+    paths += [
+        f"{base_path}{ext}"
+        for ext in (".wal", ".gen", ".npy", ".vt", ".vt.json", ".vectors")
+    ]
+    paths.append(f"{base_path}.vectors.ids")
+
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def build(type: str, embedder: ChunkEmbedder) -> None:
+    """
+    Build the index snapshot and the metadata file of a document type,
+    streaming its CSV file in chunks. After every chunk its vectors are
+    in the index write-ahead log and its rows in the metadata file, and
+    a checkpoint is written, so an interrupted build resumes after the
+    last complete chunk. The configured index is trained once, at the end.
+
+    :param type: "res" or "vac".
+    :param embedder: The embedder of the chunks.
+    """
+    csv_path, index_path = SOURCES[type]
+    meta_path = metadata_path(type)
+
+    state = read_state(type)
+    if state is not None and state["done"]:
+        print(f"{type}: already built, {state['ntotal']} rows")
+        return
+
+    # Vectors are collected in an exact index, ids are the row numbers
+    f_index = FaissIndex(
+        index_path, index_type="flat", storage="float32", reduction=None, mmap=False
+    )
+
+    if state is None:
+        if f_index.ntotal:
+            raise ValueError(
+                f"{index_path} already holds {f_index.ntotal} vectors, "
+                "remove it (--restart) to build it from scratch"
+            )
+        state = {"ntotal": 0, "meta_bytes": 0, "done": False}
+    elif f_index.ntotal < state["ntotal"]:
+        raise ValueError(f"{index_path} lost vectors, --restart the build")
+
+    # Rows written after the last checkpoint are written again
+    if os.path.exists(meta_path):
+        os.truncate(meta_path, state["meta_bytes"])
+
+    start = state["ntotal"]
+    reader = pd.read_csv(
+        csv_path,
+        chunksize=config.build_chunk_size,
+        skiprows=range(1, start + 1),
+        dtype=str,
+        keep_default_na=False,
+    )
+
+    started_at = time.perf_counter()
+    rows = 0
+    for chunk in reader:
+        chunk_started_at = time.perf_counter()
+        chunk = chunk.reset_index(drop=True)
+
+        texts = document_texts(type, chunk)
+        typed = typed_columns(type, chunk, texts)
+
+        # Vectors embedded before an interruption are kept
+        embedded = min(len(chunk), max(0, f_index.ntotal - start))
+        if embedded < len(chunk):
+            embs = await asyncio.to_thread(embedder.encode, texts[embedded:])
+            await f_index.insert(embs, compact=False)
+
+        p_ids = pd.DataFrame({"p_id": np.arange(start, start + len(chunk))})
+        meta = pd.concat([p_ids, chunk, typed], axis=1)
+        with open(meta_path, "a", newline="") as f:
+            meta.to_csv(f, header=state["meta_bytes"] == 0, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+        start += len(chunk)
+        rows += len(chunk)
+        state.update(ntotal=start, meta_bytes=os.path.getsize(meta_path))
+        write_state(type, state)
+
+        now = time.perf_counter()
+        print(
+            f"{type}: {start} rows, "
+            f"{len(chunk) / (now - chunk_started_at):.1f} rows/s "
+            f"({rows / (now - started_at):.1f} rows/s since start)"
+        )
+
+    build_started_at = time.perf_counter()
+    if config.vector_store:
+        vectors = f_index.vectors.dense()
+    else:
+        vectors = f_index.index.reconstruct_n(0, f_index.ntotal)
+
+    f_index.index_type = config.index_type
+    f_index.storage = config.index_storage
+    f_index.reduction = config.reduction
+    await f_index.rebuild(vectors)
+
+    state["done"] = True
+    write_state(type, state)
+
+    stats = f_index.stats()
+    print(
+        f"{type}: {stats['ntotal']} vectors indexed as {stats['index_type']} "
+        f"in {time.perf_counter() - build_started_at:.1f}s, "
+        f"{rows / (time.perf_counter() - started_at):.1f} rows/s overall"
+    )
+
+
+async def main(types: list[str], restart: bool, workers: int) -> None:
+    """
+    Build the given document types with one pool of model workers.
+
+    :param types: "res" and/or "vac".
+    :param restart: Whether to remove the previous builds first.
+    :param workers: Number of model worker processes.
+    """
+    os.makedirs(config.build_dir, exist_ok=True)
+
+    if restart:
+        for type in types:
+            remove_build(type)
+
+    embedder = ChunkEmbedder(start_pool(workers), workers, config.build_batch_size)
+    for type in types:
+        await build(type, embedder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build the faiss indexes and the metadata of the full datasets "
+            "offline, the API bulk loads them on startup into empty tables"
+        )
+    )
+    parser.add_argument(
+        "types", nargs="*", choices=list(SOURCES), help="default: all of them"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.build_workers,
+        help="model worker processes",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="remove the indexes, metadata and checkpoints first",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(main(args.types or list(SOURCES), args.restart, args.workers))
@@ -0,0 +1,342 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a query text to be used as a cache key.
+    Only whitespace is collapsed, since the model is case-sensitive.
+
+    :param text: The query text.
+    """
+    return " ".join(text.split())
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash a document text, so texts differing only in whitespace
+    (which get the same embedding) get the same hash.
+
+    :param text: The formatted document text.
+    """
+    return hashlib.blake2b(
+        normalize_text(text).encode(), digest_size=16
+    ).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Bounded in-process LRU cache for query embeddings with TTL.
+    Memory is accounted by the byte size of the stored float32 vectors,
+    and concurrent misses for the same key share one computation.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        """
+        :param max_bytes: Maximum total size of the stored vectors, in bytes.
+        :param ttl: Entry lifetime, in seconds.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get_or_compute(self, text: str, compute) -> np.ndarray:
+        """
+        Return the cached embedding for the text or compute it.
+
+        :param text: The query text.
+        :param compute: A coroutine function computing the embedding
+            of the normalized text.
+        """
+        key = normalize_text(text)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, emb = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return emb
+
+            self._pop(key)
+
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(compute(key))
+            task.add_done_callback(partial(self._on_done, key))
+            self.in_flight[key] = task
+        else:
+            self.coalesced += 1
+
+        # A cancelled caller must not cancel the computation others wait for
+        return await asyncio.shield(task)
+
+    async def get_many_or_compute(self, texts: list[str], compute_many) -> list:
+        """
+        Return the embeddings of many texts, computing all
+        the missing ones with a single call.
+
+        :param texts: The query texts.
+        :param compute_many: A coroutine function computing a 2D array
+            of embeddings of a list of normalized texts.
+        """
+        keys = [normalize_text(text) for text in texts]
+        now = time.monotonic()
+
+        found = {}
+        for key in dict.fromkeys(keys):
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                found[key] = entry[1]
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            self.misses += len(missing)
+            embs = await compute_many(missing)
+            for key, emb in zip(missing, embs):
+                # Copied, so an entry does not keep the whole batch alive
+                found[key] = np.array(emb, dtype="float32")
+                self._put(key, found[key])
+
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        """Return cache size and hit/miss counters."""
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        self.in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+
+        self._put(key, task.result())
+
+    def _put(self, key: str, emb: np.ndarray) -> None:
+        emb = np.asarray(emb, dtype="float32")
+        if emb.nbytes > self.max_bytes:
+            return
+
+        emb.flags.writeable = False
+
+        self._pop(key)
+        self.entries[key] = (time.monotonic() + self.ttl, emb)
+        self.nbytes += emb.nbytes
+
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _pop(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1].nbytes
+
+
+class ResultCache:
+    """
+    Bounded LRU cache for search results. Every entry is stored
+    together with the version of the index it was computed from,
+    and is served only while that version is still current.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        """
+        :param max_entries: Maximum number of stored results.
+        """
+        self.max_entries = max_entries
+
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, key: tuple, version: int):
+        """
+        Return the cached result or None.
+
+        :param key: The search key.
+        :param version: The current version of the searched index.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        entry_version, result = entry
+        if entry_version != version:
+            del self.entries[key]
+            self.stale += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key: tuple, version: int, result) -> None:
+        """
+        Store a result.
+
+        :param key: The search key.
+        :param version: The version of the index the result was computed from.
+        :param result: The search result.
+        """
+        if self.max_entries <= 0:
+            return
+
+        self.entries[key] = (version, result)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Return cache size and hit/miss counters."""
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+        }
+
+
+class DocumentEmbeddingCache:
+    """
+    Persistent content hash -> embedding cache of document texts,
+    a SQLite file shared by all workers and kept across restarts,
+    so repeated documents skip the embedder on inserts and bulk loads.
+    It has to be deleted when the embedder model changes.
+    """
+
+    # Hashes looked up per query, below the SQLite parameters limit
+    chunk_size = 500
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Path of the SQLite file.
+        """
+        self.path = path
+        self.conn = None
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    async def get_many_or_compute(self, texts: list[str], compute_many) -> np.ndarray:
+        """
+        Return the embeddings of many document texts, computing
+        the missing ones (each distinct text once) with a single call.
+
+        :param texts: The document texts.
+        :param compute_many: A coroutine function computing a 2D array
+            of embeddings of a list of texts.
+        """
+        keys = [content_hash(text) for text in texts]
+        found = await asyncio.to_thread(self.get_many, list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            embs = await compute_many(list(missing.values()))
+            computed = {
+                key: np.array(emb, dtype="float32")
+                for key, emb in zip(missing, embs)
+            }
+            await asyncio.to_thread(self.put_many, computed)
+            found |= computed
+
+        return np.vstack([found[key] for key in keys]).astype("float32", copy=False)
+
+    def get_many(self, keys: list[str]) -> dict:
+        """
+        Look up stored embeddings.
+
+        :param keys: Content hashes.
+        """
+        found = {}
+        with self.lock:
+            conn = self._connect()
+            for start in range(0, len(keys), self.chunk_size):
+                chunk = keys[start : start + self.chunk_size]
+                rows = conn.execute(
+                    "SELECT hash, vector FROM embeddings "
+                    f"WHERE hash IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype="<f4")
+
+        return found
+
+    def put_many(self, embs: dict) -> None:
+        """
+        Store embeddings, keeping already stored ones.
+
+        :param embs: A dictionary mapping content hashes to embeddings.
+        """
+        with self.lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (hash, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(emb, dtype="<f4").tobytes())
+                    for key, emb in embs.items()
+                ],
+            )
+            conn.commit()
+
+    def stats(self) -> dict:
+        """Return the hit/miss counters."""
+        return {"path": self.path, "hits": self.hits, "misses": self.misses}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # Readers of other workers are not blocked by a writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(hash TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            conn.commit()
+            self.conn = conn
+
+        return self.conn
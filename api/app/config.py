@@ -6,6 +6,52 @@ path_to_vac_index = (
 )
 topn = 10
 
+embedding_dim = 512  # 384 for MiniLM, 512 for DistilUse
+
+index_type = "flat"  # flat, ivf_flat, ivf_pq, hnsw
+# Vector storage: float32 (exact), fp16 (2x smaller, near exact) or sq8 (4x smaller)
+index_storage = "float32"
+index_params = {
+    "ivf_flat": {"nlist": 1024},
+    "ivf_pq": {"nlist": 1024, "m": 64, "nbits": 8},
+    "hnsw": {"m": 32, "ef_construction": 200},
+}
+# Trained index types are served by a flat index until enough vectors exist
+index_train_min = 10000
+# Optional PCA/OPQ reduction of document and query vectors (None, pca, opq)
+reduction = None
+reduction_dim = 128
+reduction_opq_m = 16
+index_train_size = 100000
+# Serve snapshots memory-mapped read-only (flat float32 and IVF indexes)
+index_mmap = False
+# Write-ahead log of inserted vectors, folded into snapshots by compaction
+wal_fsync = True
+wal_compact_records = 1000
+wal_compact_interval = 300
+# Keep the raw document embeddings next to the index, for re-indexing
+vector_store = True
+# Persistent text hash -> embedding cache of ingested documents (None disables),
+# it has to be deleted when the embedder model changes
+document_cache_path = "init_data/embeddings.sqlite"
+# Attach documents with an already indexed text to its vector
+# instead of adding a duplicate one
+dedup_attach = False
+# How often every worker checks for snapshots and log records of other workers
+index_refresh_interval = 0.5
+seed_lock_path = "init_data/seed.lock"
+# Inserts are committed in groups of up to N items or after M ms
+writer_max_batch_size = 64
+writer_max_wait_ms = 10
+# Faiss thread pools, 0 OpenMP threads keeps the faiss default
+faiss_search_workers = 4
+faiss_search_omp_threads = 1
+faiss_write_workers = 1
+faiss_write_omp_threads = 0
+# Default search-time parameters, can be overridden per request
+nprobe = 16
+ef_search = 64
+
 path_to_res = "init_data/resume_train_no_index.csv"
 res_faiss_func = (
     lambda x: f"Ищет работу на должность: {x['job_title']}; {x['experience']}; {x['edu']}"
@@ -16,9 +62,50 @@ vac_faiss_func = (
     lambda x: f"{x['descr']}; {x['key_req']}; {x['spec']}. Требуемый опыт: {x['req_exp']}"
 )
 
+# Seeding of the empty database from the CSV files
+seed_sample_size = 1000  # rows per file, None loads all of them
+# Texts per embedder request, at most MAX_REQUEST_TEXTS of the embedder
+seed_batch_size = 256
+seed_concurrency = 4  # embedder requests in flight
+
+# Offline builder of the full datasets (app.build): metadata and checkpoints
+# go to build_dir, the model runs in processes of the embedder in its directory
+build_dir = "init_data/build"
+build_chunk_size = 10000  # CSV rows per chunk and checkpoint
+build_batch_size = 256  # texts per model call
+build_workers = 2
+build_embedder_dir = "../embedder"
+
 healthcheck_timeout = 30
 healthcheck_sleep = 5
 
+embedder_pool_size = 64
+embedder_keepalive = 60
+embedder_timeout = 30
+embedder_retries = 3
+embedder_backoff = 0.5
+embedder_wire_dtype = "float32"  # float32, float16 or json
+
+query_cache_max_bytes = 64 * 2**20
+query_cache_ttl = 600
+
+result_cache_max_entries = 4096
+
+# Opt-in coalescing of concurrent single searches into one faiss call
+search_coalesce = False
+search_coalesce_max_size = 64
+search_coalesce_window_ms = 2
+
+# Rows parsed per chunk when backfilling the typed columns
+typed_backfill_chunk = 10000
+# Vectors without a committed row (a failed insert) are looked up again
+# by the next N filtered searches only, their attributes never match
+attribute_sync_retries = 20
+
+# Limits of the batch search endpoints, the texts are embedded in one request
+search_batch_max_size = 256
+search_batch_max_chars = 500000
+
 min_max_lens = {
     "job_title": (5, 30),
     "experience": (20, 2000),
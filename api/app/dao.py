@@ -1,57 +1,163 @@
+import asyncio
+import csv
 import os
-from itertools import chain
 from collections import defaultdict
+from functools import partial
 
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 from fastapi import HTTPException
 from fastapi import status
-import faiss
 import numpy as np
 import pandas as pd
 import sqlalchemy as sa
-import aiohttp
+from sqlalchemy.dialects.postgresql import ARRAY, BIGINT, TEXT
 
-from app.pg_models import Resumes, Vacancies
+from app.pg_models import Resumes, Vacancies, resume_dup_ids, vacancy_dup_ids
 import app.config as config
-from app.database import Base
+from app.database import Base, async_session_maker
+from app.faiss_pool import search_pool
+from app.indexes import FaissIndex
+from app.build import metadata_path, read_state
+from app import embedder_client
+from app.cache import (
+    DocumentEmbeddingCache,
+    EmbeddingCache,
+    ResultCache,
+    normalize_text,
+)
+from app.writer import GroupWriter
+from app.attributes import AttributeStore, SearchFilters
+from app.parsing import (
+    TYPED_COLUMNS,
+    document_texts,
+    typed_columns,
+    typed_records,
+)
 
 
 TYPE_TABLE = {
     "res": [Resumes, config.res_faiss_func],
     "vac": [Vacancies, config.vac_faiss_func],
 }
+DUP_IDS = {"res": resume_dup_ids, "vac": vacancy_dup_ids}
+# The primary key and the text columns, as returned in search results
+RESULT_COLUMNS = {
+    _cls: [
+        column
+        for column in _cls.__table__.c
+        if column.name not in TYPED_COLUMNS[type] + ["dup_count", "vec_id"]
+    ]
+    for type, (_cls, _) in TYPE_TABLE.items()
+}
+
+query_cache = EmbeddingCache(
+    max_bytes=config.query_cache_max_bytes, ttl=config.query_cache_ttl
+)
+result_cache = ResultCache(max_entries=config.result_cache_max_entries)
+document_cache = (
+    DocumentEmbeddingCache(config.document_cache_path)
+    if config.document_cache_path
+    else None
+)
+# Search coalescing queues, one per Faiss index
+search_batchers = {}
+# Filterable attributes of the indexed documents, by faiss id
+attribute_stores = {type: AttributeStore(type) for type in TYPE_TABLE}
 
 
 async def get_text_embedding(text):
     """
     Retrieves the embedding vector for a given
-    text by sending a GET request to an embedding service API.
+    text by sending it to the embedding service API
+    through the application-scoped HTTP client.
 
     Args:
         text (str): The text for which the
         embedding will be retrieved.
 
     Returns:
-        list: The embedding vector of the query text.
+        np.ndarray: The float32 embedding vector of the query text.
+    """
+    return await embedder_client.client.embed(text)
+
+
+async def get_query_embedding(text):
+    """
+    Retrieves the embedding vector for a search query,
+    serving repeated queries from the in-process cache.
+
+    Args:
+        text (str): The query text.
+
+    Returns:
+        np.ndarray: The float32 embedding vector of the query text.
+    """
+    return await query_cache.get_or_compute(text, get_text_embedding)
+
+
+async def get_query_embeddings(texts):
+    """
+    Retrieves the embedding vectors for many search queries
+    with at most one embedder call, serving the cached ones
+    from the in-process cache.
+
+    Args:
+        texts (list[str]): The query texts.
+
+    Returns:
+        np.ndarray: A float32 matrix with one embedding per text.
     """
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{os.getenv('EMBEDDER_URL')}/search?user_text={text}"
-        ) as resp:
-            responce = await resp.json()
+    embs = await query_cache.get_many_or_compute(
+        texts, embedder_client.client.embed_batch
+    )
+    return np.vstack(embs).astype("float32", copy=False)
 
-    return responce["query_embedding"]
 
+async def get_document_embeddings(texts):
+    """
+    Retrieves the embedding vectors for document texts being
+    ingested with at most one embedder call, serving repeated
+    texts from the persistent document embedding cache.
+
+    Args:
+        texts (list[str]): The formatted document texts.
 
-def faiss_search_result(query_embedding, f_index: faiss.IndexFlatL2):
+    Returns:
+        np.ndarray: A float32 matrix with one embedding per text.
+    """
+    if not texts:
+        return np.empty((0, config.embedding_dim), dtype="float32")
+
+    if document_cache is None:
+        embs = await embedder_client.client.embed_batch(texts)
+        return np.asarray(embs, dtype="float32")
+
+    return await document_cache.get_many_or_compute(
+        texts, embedder_client.client.embed_batch
+    )
+
+
+async def faiss_search_result(
+    query_embedding, f_index: FaissIndex, nprobe=None, ef_search=None, mask=None
+):
     """
     Find the nearest neighbor embedding IDs and
     distances for a given query embedding using a Faiss index.
+    The search itself runs in the faiss thread pool. With
+    `config.search_coalesce` concurrent unfiltered queries to the same
+    index are gathered for a short window and searched together.
 
     Args:
-        query_embedding (list): The embedding vector of the query.
+        query_embedding (np.ndarray): The embedding vector of the query.
 
-        f_index (faiss.IndexFlatL2): The Faiss index used for searching.
+        f_index (FaissIndex): The Faiss index used for searching.
+
+        nprobe (int, optional): Number of IVF lists to scan.
+
+        ef_search (int, optional): HNSW search queue size.
+
+        mask (np.ndarray, optional): Boolean array of the embedding IDs
+        allowed in the results, applied during the search.
 
     Returns:
         tuple: A tuple containing two lists:
@@ -60,173 +166,573 @@ def faiss_search_result(query_embedding, f_index: faiss.IndexFlatL2):
             - embedding_distances (list): A list of distances between
             the query embedding and the nearest neighbors.
     """
-    embedding_distances, embedding_ids = f_index.search(
-        np.array([query_embedding]).astype("float32"), config.topn
+    query_embedding = np.asarray(query_embedding, dtype="float32")
+
+    if config.search_coalesce and mask is None:
+        batcher = search_batchers.get(f_index)
+        if batcher is None:
+            batcher = search_batchers[f_index] = GroupWriter(
+                partial(search_group, f_index=f_index),
+                max_batch_size=config.search_coalesce_max_size,
+                max_wait_ms=config.search_coalesce_window_ms,
+                # One group per search thread, so coalescing never idles them
+                concurrency=search_pool.max_workers,
+            )
+
+        return await batcher.submit((query_embedding, nprobe, ef_search))
+
+    embedding_distances, embedding_ids = await f_index.search(
+        query_embedding.reshape(1, -1),
+        config.topn,
+        nprobe=nprobe,
+        ef_search=ef_search,
+        mask=mask,
     )
     return embedding_ids[0], embedding_distances[0]
 
 
-async def insert_data_to_pg(cols, table: Base, session: AsyncSession):
+async def search_group(items, f_index: FaissIndex):
     """
-    Insert data into a PostgreSQL database
-    table using SQLAlchemy and return the primary key of the inserted row.
+    Search the nearest neighbors of a group of coalesced single
+    queries, with one multi-row search per distinct set of
+    search-time parameters.
 
     Args:
-        cols (tuple): A tuple representing the
-        values to be inserted into the table.
+        items (list[tuple]): (query_embedding, nprobe, ef_search) tuples.
+
+        f_index (FaissIndex): The Faiss index used for searching.
+
+    Returns:
+        list[tuple]: (embedding_ids, embedding_distances) tuples,
+        in the order of `items`.
+    """
+    positions = defaultdict(list)
+    for i, (_, nprobe, ef_search) in enumerate(items):
+        positions[nprobe, ef_search].append(i)
+
+    results = [None] * len(items)
+    for (nprobe, ef_search), idx in positions.items():
+        embedding_distances, embedding_ids = await f_index.search(
+            np.vstack([items[i][0] for i in idx]),
+            config.topn,
+            nprobe=nprobe,
+            ef_search=ef_search,
+        )
+        for i, ids, distances in zip(idx, embedding_ids, embedding_distances):
+            results[i] = (ids, distances)
 
+    return results
+
+
+async def find_duplicates(table: Base, hashes, session: AsyncSession):
+    """
+    Find the already stored documents with the given text hashes.
+
+    Args:
         table (Base): The SQLAlchemy Base object
         representing the database table.
 
+        hashes (list[str]): Content hashes of the document texts.
+
         session (AsyncSession): An AsyncSession object
         representing the database session.
 
     Returns:
-        int: The primary key of the
-        inserted row in the database table.
+        dict[str, int]: A dictionary mapping the found hashes to the
+        faiss id of the first indexed document with that hash.
     """
-    q = sa.insert(table).values(cols).returning(table.p_id)
+    if not hashes:
+        return {}
+
+    q = (
+        sa.select(table.content_hash, sa.func.min(table.p_id))
+        .where(
+            table.content_hash
+            == sa.any_(sa.bindparam("hashes", list(hashes), type_=ARRAY(TEXT))),
+            table.vec_id.is_(None),
+        )
+        .group_by(table.content_hash)
+    )
     q = await session.execute(q)
-    p_id = q.scalar_one_or_none()
 
-    return p_id
+    return dict(q.all())
 
 
-async def insert_data(
-    row: dict,
-    faiss_str: str,
-    table: Base,
-    session: AsyncSession,
-    f_index: faiss.IndexFlatL2,
-):
+async def allocate_dup_ids(type, n, session: AsyncSession):
     """
-    Insert data into a PostgreSQL database table and update a Faiss index.
+    Allocate primary keys for duplicates attached to another vector.
 
     Args:
-        row (dict): A dictionary representing the
-        values to be inserted into the table.
+        type (str): The type of the documents.
+
+        n (int): The number of keys.
+
+        session (AsyncSession): An AsyncSession object
+        representing the database session.
+
+    Returns:
+        list[int]: The (negative) primary keys.
+    """
+    if not n:
+        return []
+
+    q = sa.select(DUP_IDS[type].next_value()).select_from(
+        sa.func.generate_series(1, n)
+    )
+    q = await session.execute(q)
+
+    return list(q.scalars())
+
 
-        faiss_str (str): A string representing the text
-        for which the embedding will be retrieved.
+async def count_duplicates(table: Base, counts, session: AsyncSession):
+    """
+    Increase the number of duplicates attached to documents.
 
+    Args:
         table (Base): The SQLAlchemy Base object
         representing the database table.
 
+        counts (dict[int, int]): A dictionary mapping the primary keys
+        of the documents to the number of newly attached duplicates.
+
         session (AsyncSession): An AsyncSession object
         representing the database session.
 
-        f_index (faiss.IndexFlatL2): A Faiss IndexFlatL2 object
-        representing the Faiss index.
+    Returns:
+        None
+    """
+    if not counts:
+        return
+
+    q = (
+        sa.update(table.__table__)
+        .where(table.p_id == sa.bindparam("_p_id"))
+        .values(
+            dup_count=sa.func.coalesce(table.dup_count, 0)
+            + sa.bindparam("_n", type_=sa.Integer)
+        )
+    )
+    await session.execute(
+        q, [{"_p_id": p_id, "_n": n} for p_id, n in counts.items()]
+    )
+
+
+async def upgrade_typed_columns(conn: AsyncConnection):
+    """
+    Add the columns and indexes missing in tables created before
+    them, then backfill the typed columns from the text columns
+    of the existing rows, one chunk at a time.
+
+    Args:
+        conn (AsyncConnection): An asynchronous database connection.
 
     Returns:
-        int: The primary key of the inserted row in the database table.
+        None
     """
-    f_id = f_index.ntotal
+    for type, (_cls, _) in TYPE_TABLE.items():
+        table = _cls.__table__
+
+        for column in table.c:
+            if column.primary_key:
+                continue
+
+            col_type = column.type.compile(dialect=conn.dialect)
+            await conn.execute(
+                sa.text(
+                    f"ALTER TABLE {table.name} "
+                    f"ADD COLUMN IF NOT EXISTS {column.name} {col_type}"
+                )
+            )
+
+        for index in table.indexes:
+            await conn.run_sync(index.create, checkfirst=True)
+
+        # The normalized city and the hash are never NULL once parsed
+        text_cols = [c for c in table.c if c.name not in TYPED_COLUMNS[type]]
+        q = (
+            sa.select(*text_cols)
+            .where(
+                sa.or_(table.c.city_norm.is_(None), table.c.content_hash.is_(None))
+            )
+            .order_by(table.c.p_id)
+            .limit(config.typed_backfill_chunk)
+        )
+        upd = sa.update(table).where(table.c.p_id == sa.bindparam("_p_id"))
 
-    e = await get_text_embedding(faiss_str)
-    embedding = np.array([e]).astype("float32")
-    f_index.add(embedding)
+        while True:
+            rows = await conn.execute(q)
+            df = pd.DataFrame(rows.all(), columns=list(rows.keys()))
+            if df.empty:
+                break
 
-    await insert_data_to_pg(
-        cols=tuple([f_id]) + tuple(row.values()), table=table, session=session
-    )
+            typed = typed_records(typed_columns(type, df))
+            await conn.execute(
+                upd,
+                [{"_p_id": p_id} | t for p_id, t in zip(df["p_id"].tolist(), typed)],
+            )
+
+
+async def load_built_data(conn: AsyncConnection, f_indexes: dict[str, FaissIndex]):
+    """
+    Bulk load the metadata files of the offline builder (`app.build`)
+    into empty tables with COPY. The builder has written the index
+    snapshots in place, so the indexes already hold the vectors.
+    Fails if a table holds other rows than the ones of its build.
+
+    Args:
+        conn (AsyncConnection): An asynchronous database connection.
+
+        f_indexes (dict[str, FaissIndex]): A dictionary
+        containing Faiss indexes and their snapshot paths as values.
+
+    Returns:
+        None
+    """
+    for type, (_cls, _) in TYPE_TABLE.items():
+        state = read_state(type)
+        if state is None or not state["done"]:
+            continue
+
+        # The metadata must describe exactly the vectors of the index
+        if f_indexes[type].ntotal != state["ntotal"]:
+            continue
+
+        # Loaded before, unless the rows are of another index (e.g. seeded
+        # before a rebuild), which would be served with the wrong vectors
+        table = _cls.__table__
+        q = await conn.execute(
+            sa.select(sa.func.count())
+            .select_from(table)
+            .where(table.c.vec_id.is_(None))
+        )
+        rows = q.scalar()
+        if rows:
+            if rows != state["ntotal"]:
+                raise ValueError(
+                    f"{table.name} holds {rows} rows, but the built '{type}' "
+                    f"index holds {state['ntotal']} vectors: empty the table "
+                    "to load the build"
+                )
+            continue
+
+        path = metadata_path(type)
+        with open(path, newline="") as f:
+            columns = next(csv.reader(f))
+
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_to_table(
+            table.name,
+            source=os.path.abspath(path),
+            columns=columns,
+            format="csv",
+            header=True,
+            # Empty texts are empty strings, empty typed values are NULL
+            force_not_null=[
+                c for c in columns if c != "p_id" and c not in TYPED_COLUMNS[type]
+            ],
+        )
+
+
+def read_seed_data(path):
+    """
+    Reads the sample of a CSV file the database is seeded with.
+
+    Args:
+        path (str): The path of the CSV file.
+
+    Returns:
+        pd.DataFrame: Up to `config.seed_sample_size` random rows,
+        with missing values as empty strings.
+    """
+    df = pd.read_csv(path)
+    df = df.fillna("")
+    df = df.astype(str)
+
+    if config.seed_sample_size is not None and len(df) > config.seed_sample_size:
+        df = df.sample(n=config.seed_sample_size)
+
+    return df.reset_index(drop=True)
+
+
+async def seed_table(type, df, session: AsyncSession, f_index: FaissIndex):
+    """
+    Loads the rows of one document type as a pipeline: the texts
+    are embedded in batches by up to `config.seed_concurrency`
+    concurrent requests, and every embedded batch is added to the
+    Faiss index and bulk inserted while the next ones are embedded.
+
+    Args:
+        type (str): The type of the documents.
+
+        df (pd.DataFrame): The rows to load.
+
+        session (AsyncSession): An AsyncSession object
+        representing the database session.
+
+        f_index (FaissIndex): The Faiss index to add the embeddings to.
+
+    Returns:
+        None
+    """
+    _cls, _ = TYPE_TABLE[type]
+
+    texts = document_texts(type, df)
+    typed = typed_columns(type, df, texts)
+
+    records = [
+        row | typed_row
+        for row, typed_row in zip(df.to_dict("records"), typed_records(typed))
+    ]
+
+    # Duplicates are inserted once the documents they are attached to are
+    dup_records = []
+    if config.dedup_attach:
+        dup = typed["content_hash"].duplicated().to_numpy()
+        dup_records = [r for r, d in zip(records, dup) if d]
+        records = [r for r, d in zip(records, dup) if not d]
+        texts = [text for text, d in zip(texts, dup) if not d]
+
+    slots = asyncio.Semaphore(config.seed_concurrency)
+
+    async def embed(start):
+        async with slots:
+            batch = texts[start : start + config.seed_batch_size]
+            return start, await get_document_embeddings(batch)
+
+    tasks = [
+        asyncio.ensure_future(embed(start))
+        for start in range(0, len(texts), config.seed_batch_size)
+    ]
+
+    hash_ids = {}
+    try:
+        # Batches are loaded in the order they are embedded in
+        for next_batch in asyncio.as_completed(tasks):
+            start, embs = await next_batch
+            ids = await f_index.insert(embs, compact=False)
+
+            batch = records[start : start + len(ids)]
+            await session.execute(
+                sa.insert(_cls),
+                [{"p_id": p_id} | record for p_id, record in zip(ids, batch)],
+            )
+
+            for p_id, record in zip(ids, batch):
+                hash_ids[record["content_hash"]] = p_id
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if dup_records:
+        dup_ids = await allocate_dup_ids(type, len(dup_records), session)
+        await session.execute(
+            sa.insert(_cls),
+            [
+                {"p_id": p_id, "vec_id": hash_ids[record["content_hash"]]} | record
+                for p_id, record in zip(dup_ids, dup_records)
+            ],
+        )
+
+        counts = defaultdict(int)
+        for record in dup_records:
+            counts[hash_ids[record["content_hash"]]] += 1
+        await count_duplicates(_cls, counts, session)
 
 
 async def init_db(
-    session: AsyncSession, f_indexes: dict[str, tuple[faiss.IndexFlatL2, str]]
+    session: AsyncSession, f_indexes: dict[str, FaissIndex]
 ):
     """
     Initializes the database by inserting data from CSV files
-    into corresponding database tables and updating Faiss indexes.
+    into corresponding database tables and updating Faiss indexes
+    (see `seed_table`). The indexes are written once at the end,
+    and cleared again if loading fails.
 
     Args:
         session (AsyncSession): An AsyncSession object
         representing the database session.
 
-        f_indexes (dict[str, tuple[faiss.IndexFlatL2, str]]): A dictionary
-        containing Faiss indexes and their corresponding column names as values.
+        f_indexes (dict[str, FaissIndex]): A dictionary
+        containing Faiss indexes and their snapshot paths as values.
 
     Returns:
         None
     """
-    if any(fi[0].ntotal for fi in f_indexes.values()):
+    if any(fi.ntotal for fi in f_indexes.values()):
         return
 
-    res = pd.read_csv(config.path_to_res)
-    res = res.fillna("")
-    res = res.astype(str)
-    res = res.sample(n=1000)
-    res["type"] = "res"
-
-    vac = pd.read_csv(config.path_to_vac)
-    vac = vac.fillna("")
-    vac = vac.astype(str)
-    vac = vac.sample(n=1000)
-    vac["type"] = "vac"
+    data = {
+        "res": read_seed_data(config.path_to_res),
+        "vac": read_seed_data(config.path_to_vac),
+    }
 
-    if res.empty or vac.empty:
+    if any(df.empty for df in data.values()):
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="File is broken or wrong columns are specified",
         )
 
-    for _, row in chain(res.iterrows(), vac.iterrows()):
-        _cls, faiss_str_func = TYPE_TABLE[row["type"]]
+    try:
+        for type, df in data.items():
+            await seed_table(type, df, session, f_indexes[type])
 
-        await insert_data(
-            row=row.drop(labels=["type"]).to_dict(),
-            faiss_str=faiss_str_func(row),
-            table=_cls,
-            session=session,
-            f_index=f_indexes[row["type"]][0],
-        )
+        for _, v in f_indexes.items():
+            await v.save()
 
-    for _, v in f_indexes.items():
-        faiss.write_index(v[0], v[1])
-        v[0] = faiss.read_index(v[1])
+        await session.commit()
+    except Exception:
+        # Vectors left without rows would block seeding on the next start
+        for v in f_indexes.values():
+            await v.clear()
+        raise
 
-    await session.commit()
+    for v in f_indexes.values():
+        await v.mark_committed()
 
 
-async def get_metainf_by_text(table: Base, faiss_id, session: AsyncSession):
+async def get_metainf_by_ids(table: Base, faiss_ids, session: AsyncSession):
     """
-    Retrieves metadata information from a
-    database table based on a given ID.
+    Retrieves metadata information from a database table
+    for a list of IDs in a single round-trip.
 
     Args:
         table (Base): A SQLAlchemy table object
         representing the database table.
 
-        faiss_id: The ID of the record in the table.
+        faiss_ids: The IDs of the records in the table, in rank order.
+        Missing faiss results (-1) are skipped.
 
         session (AsyncSession): An asynchronous database session object.
 
     Returns:
-        dict: A dictionary containing the metadata information
-        retrieved from the database table.
-        The keys of the dictionary are the column names of the table,
-        and the values are the corresponding attribute
-        values of the retrieved record.
+        list[dict]: A list of dictionaries containing the metadata
+        information of the found records, in the order of `faiss_ids`.
+        The keys of the dictionaries are the column names of the table,
+        and the values are the corresponding values of the record.
+    """
+    ids = [int(i) for i in faiss_ids if i != -1]
+    rows = await get_rows_by_ids(table, ids, session)
+
+    return [rows[i] for i in ids if i in rows]
+
+
+async def get_rows_by_ids(table: Base, ids, session: AsyncSession):
+    """
+    Retrieves the records of a database table
+    with the given IDs in a single query.
+
+    Args:
+        table (Base): A SQLAlchemy table object
+        representing the database table.
+
+        ids (list[int]): The IDs of the records.
+
+        session (AsyncSession): An asynchronous database session object.
+
+    Returns:
+        dict[int, dict]: A dictionary mapping the IDs of the found
+        records to their metadata information (the names of the
+        primary key and text columns to the string values of the record).
     """
-    q = sa.select(table).where(table.p_id == faiss_id)
+    if not ids:
+        return {}
+
+    q = sa.select(*RESULT_COLUMNS[table]).where(
+        table.p_id == sa.any_(sa.bindparam("ids", ids, type_=ARRAY(BIGINT)))
+    )
     q = await session.execute(q)
-    res = q.fetchone()[0]
 
-    return {c.name: str(getattr(res, c.name)) for c in res.__table__.columns}
+    return {row.p_id: {k: str(v) for k, v in row._mapping.items()} for row in q}
+
+
+async def sync_attributes(type, session: AsyncSession, ntotal):
+    """
+    Load the filterable attributes of the documents, which are in
+    the Faiss index but not in the attribute store yet: all of them
+    on startup, then the ones inserted by other workers.
+
+    The ids are claimed under the store lock and read without it, so
+    concurrent searches never wait for the database. Ids without a
+    committed row are retried by up to `config.attribute_sync_retries`
+    later calls, then dropped: their attributes never match.
+
+    Args:
+        type (str): The type of the documents.
+
+        session (AsyncSession): An asynchronous
+        database session object.
+
+        ntotal (int): The number of vectors in the Faiss index.
+
+    Returns:
+        None
+    """
+    store = attribute_stores[type]
+    _cls, _ = TYPE_TABLE[type]
+
+    async with store.lock:
+        if store.synced >= ntotal and not len(store.pending):
+            return
+
+        start, end = store.synced, max(ntotal, store.synced)
+        retried = store.pending
+        store.synced = end
+        store.pending = np.empty(0, dtype="int64")
+
+    expected = np.concatenate([retried, np.arange(start, end)])
+    try:
+        pending = sa.bindparam("pending", retried.tolist(), type_=ARRAY(BIGINT))
+        q = sa.select(
+            _cls.p_id, *[getattr(_cls, c) for c in TYPED_COLUMNS[type]]
+        ).where(
+            sa.or_(
+                sa.and_(_cls.p_id >= start, _cls.p_id < end),
+                _cls.p_id == sa.any_(pending),
+            )
+        )
+        q = await session.execute(q)
+        df = pd.DataFrame(q.all(), columns=list(q.keys()))
+    except BaseException:
+        # Claimed ids are given back to the next call
+        async with store.lock:
+            store.pending = np.union1d(store.pending, expected)
+        raise
+
+    ids = df["p_id"].to_numpy(dtype="int64")
+
+    async with store.lock:
+        store.set(ids, df)
+
+        # Vectors, which rows are not committed yet, are retried later
+        missing = []
+        for p_id in np.setdiff1d(expected, ids).tolist():
+            attempts = store.attempts.get(p_id, 0) + 1
+            if attempts < config.attribute_sync_retries:
+                store.attempts[p_id] = attempts
+                missing.append(p_id)
+            else:
+                store.attempts.pop(p_id, None)
+        for p_id in np.intersect1d(retried, ids).tolist():
+            store.attempts.pop(p_id, None)
+
+        store.pending = np.union1d(store.pending, np.asarray(missing, dtype="int64"))
 
 
 async def search_by_embedding(
     embedding,
     type,
     session: AsyncSession,
-    f_indexes: dict[str, tuple[faiss.IndexFlatL2, str]],
+    f_indexes: dict[str, FaissIndex],
+    filters: SearchFilters | None = None,
+    nprobe=None,
+    ef_search=None,
 ):
     """
     Retrieve metadata information from a
     database table based on a given embedding.
 
     Args:
-        embedding (list): The embedding vector for
+        embedding (np.ndarray): The embedding vector for
         which to search for nearest neighbors.
 
         type (str): The type of the embedding, which
@@ -235,8 +741,15 @@ async def search_by_embedding(
         session (AsyncSession): An asynchronous
         database session object.
 
-        f_indexes (dict[str, tuple[faiss.IndexFlatL2, str]]): A dictionary mapping the
-        embedding type to a tuple containing the Faiss index and the index name.
+        f_indexes (dict[str, FaissIndex]): A dictionary mapping the
+        embedding type to the Faiss index and its snapshot path.
+
+        filters (SearchFilters, optional): Attribute filters, which
+        are evaluated over the attribute store before the search.
+
+        nprobe (int, optional): Number of IVF lists to scan.
+
+        ef_search (int, optional): HNSW search queue size.
 
     Returns:
         dict: A dictionary containing the metadata information
@@ -244,32 +757,282 @@ async def search_by_embedding(
         are the column names of the table, and the values are the
         corresponding attribute values of the retrieved record.
     """
-    f_index = f_indexes[type][0]
-    embedding_ids, _ = faiss_search_result(embedding, f_index)
-
-    res_dict = defaultdict(list)
-    for index_id in embedding_ids:
-        _cls, _ = TYPE_TABLE[type]
+    mask = None
+    if filters is not None and filters.any():
+        ntotal = f_indexes[type].ntotal
+        await sync_attributes(type, session, ntotal)
+        mask = attribute_stores[type].mask(filters, ntotal)
+
+    embedding_ids, _ = await faiss_search_result(
+        embedding, f_indexes[type], nprobe=nprobe, ef_search=ef_search, mask=mask
+    )
 
-        metainfo = await get_metainf_by_text(_cls, index_id, session)
-        if not metainfo:
-            continue
+    _cls, _ = TYPE_TABLE[type]
 
+    res_dict = defaultdict(list)
+    for metainfo in await get_metainf_by_ids(_cls, embedding_ids, session):
         for k, v in metainfo.items():
             res_dict[k].append(v)
 
     return res_dict
 
 
+async def search_by_text(
+    text,
+    type,
+    session: AsyncSession,
+    f_indexes: dict[str, FaissIndex],
+    filters=None,
+    nprobe=None,
+    ef_search=None,
+):
+    """
+    Retrieve metadata information of the nearest neighbors
+    of a given text, serving repeated searches from the result
+    cache while the searched index has not changed.
+
+    Args:
+        text (str): The query text.
+
+        type (str): The type of the searched documents, which
+        determines the Faiss index and the database table to query.
+
+        session (AsyncSession): An asynchronous
+        database session object.
+
+        f_indexes (dict[str, FaissIndex]): A dictionary mapping the
+        embedding type to the Faiss index and its snapshot path.
+
+        filters (SearchFilters, optional): Attribute filters,
+        part of the cache key.
+
+        nprobe (int, optional): Number of IVF lists to scan.
+
+        ef_search (int, optional): HNSW search queue size.
+
+    Returns:
+        dict: A dictionary containing the metadata information
+        retrieved from the database table (see `search_by_embedding`).
+    """
+    key = (type, normalize_text(text), config.topn, filters, nprobe, ef_search)
+
+    # Picks up the commits of other workers, cache hits never search
+    await f_indexes[type].maybe_refresh()
+    # Captured before searching, so a concurrent insert makes the entry stale
+    version = f_indexes[type].version
+
+    result = result_cache.get(key, version)
+    if result is not None:
+        return result
+
+    q_emb = await get_query_embedding(text)
+
+    result = await search_by_embedding(
+        embedding=q_emb,
+        type=type,
+        session=session,
+        f_indexes=f_indexes,
+        filters=filters,
+        nprobe=nprobe,
+        ef_search=ef_search,
+    )
+    result_cache.put(key, version, result)
+
+    return result
+
+
+async def insert_rows(items):
+    """
+    Apply a group of queued inserts: one embedder call for all
+    texts, then one index append and one bulk insert per type,
+    and a single commit for the whole group.
+
+    With `config.dedup_attach` documents, which text is already
+    stored (or repeated within the group), are attached to the vector
+    of the first document with that text: their rows are inserted with
+    their own (negative) primary key and the faiss id in `vec_id`, but
+    no embedding is added for them.
+
+    The ids are allocated by the Faiss index under its writer lock.
+    Vectors whose rows fail to commit stay in the index, but are
+    never returned, since search results without rows are skipped.
+
+    Args:
+        items (list[tuple]): (type, row, f_index) tuples, where row
+        is a dictionary of the column values of the new record.
+
+    Returns:
+        list[int]: The primary keys of the inserted rows,
+        in the order of `items`.
+    """
+    positions = defaultdict(list)
+    for i, (type, _, _) in enumerate(items):
+        positions[type].append(i)
+
+    p_ids = [None] * len(items)
+    typed = {}
+    # Positions (within the type) of the items getting a new vector and row
+    added = {}
+    # Hashes of the indexed documents, mapped to their faiss ids
+    known = {}
+
+    async with async_session_maker() as session:
+        for type, idx in positions.items():
+            _cls, _ = TYPE_TABLE[type]
+            typed[type] = typed_columns(type, pd.DataFrame([items[i][1] for i in idx]))
+            hashes = typed[type]["content_hash"].tolist()
+
+            known[type] = {}
+            if config.dedup_attach:
+                known[type] = await find_duplicates(_cls, hashes, session)
+
+            added[type] = []
+            seen = set(known[type])
+            for j, h in enumerate(hashes):
+                if not config.dedup_attach or h not in seen:
+                    added[type].append(j)
+                    seen.add(h)
+
+        texts = [
+            TYPE_TABLE[type][1](items[positions[type][j]][1])
+            for type in positions
+            for j in added[type]
+        ]
+        embs = await get_document_embeddings(texts)
+
+        offset = 0
+        for type, idx in positions.items():
+            _cls, _ = TYPE_TABLE[type]
+            f_index = items[idx[0]][2]
+            new = added[type]
+            hashes = typed[type]["content_hash"].tolist()
+            records = typed_records(typed[type])
+
+            ids = []
+            if new:
+                ids = await f_index.insert(embs[offset : offset + len(new)])
+                offset += len(new)
+
+                await session.execute(
+                    sa.insert(_cls),
+                    [
+                        {"p_id": p_id} | items[idx[j]][1] | records[j]
+                        for p_id, j in zip(ids, new)
+                    ],
+                )
+
+            for p_id, j in zip(ids, new):
+                p_ids[idx[j]] = p_id
+                known[type].setdefault(hashes[j], p_id)
+
+            # The remaining items are duplicates
+            dups = [j for j, i in enumerate(idx) if p_ids[i] is None]
+            if dups:
+                dup_ids = await allocate_dup_ids(type, len(dups), session)
+                await session.execute(
+                    sa.insert(_cls),
+                    [
+                        {"p_id": p_id, "vec_id": known[type][hashes[j]]}
+                        | items[idx[j]][1]
+                        | records[j]
+                        for p_id, j in zip(dup_ids, dups)
+                    ],
+                )
+
+                counts = defaultdict(int)
+                for p_id, j in zip(dup_ids, dups):
+                    p_ids[idx[j]] = p_id
+                    counts[known[type][hashes[j]]] += 1
+                await count_duplicates(_cls, counts, session)
+
+        await session.commit()
+
+    for type, idx in positions.items():
+        new = added[type]
+        attribute_stores[type].set(
+            [p_ids[idx[j]] for j in new], typed[type].iloc[new]
+        )
+
+        # Signalled after commit, so cached results always see the new rows
+        await items[idx[0]][2].mark_committed()
+
+    return p_ids
+
+
+writer = GroupWriter(
+    insert_rows,
+    max_batch_size=config.writer_max_batch_size,
+    max_wait_ms=config.writer_max_wait_ms,
+)
+
+
+async def search_by_texts(
+    texts,
+    type,
+    session: AsyncSession,
+    f_indexes: dict[str, FaissIndex],
+    nprobe=None,
+    ef_search=None,
+):
+    """
+    Retrieve metadata information of the nearest neighbors of
+    many texts at once: one embedder call for the uncached texts,
+    one matrix search and one database query for all the rows.
+
+    Args:
+        texts (list[str]): The query texts.
+
+        type (str): The type of the searched documents, which
+        determines the Faiss index and the database table to query.
+
+        session (AsyncSession): An asynchronous
+        database session object.
+
+        f_indexes (dict[str, FaissIndex]): A dictionary mapping the
+        embedding type to the Faiss index and its snapshot path.
+
+        nprobe (int, optional): Number of IVF lists to scan.
+
+        ef_search (int, optional): HNSW search queue size.
+
+    Returns:
+        list[dict]: One dictionary per query text, in the order
+        of `texts`, shaped as the result of `search_by_embedding`.
+    """
+    q_embs = await get_query_embeddings(texts)
+
+    _, embedding_ids = await f_indexes[type].search(
+        q_embs, config.topn, nprobe=nprobe, ef_search=ef_search
+    )
+
+    _cls, _ = TYPE_TABLE[type]
+
+    ids = {int(i) for i in embedding_ids.ravel() if i != -1}
+    rows = await get_rows_by_ids(_cls, list(ids), session)
+
+    results = []
+    for query_ids in embedding_ids:
+        res_dict = defaultdict(list)
+        for i in query_ids:
+            for k, v in rows.get(int(i), {}).items():
+                res_dict[k].append(v)
+
+        results.append(res_dict)
+
+    return results
+
+
 async def update(
     data_to_add,
     type,
-    session: AsyncSession,
-    f_indexes: dict[str, tuple[faiss.IndexFlatL2, str]],
+    f_indexes: dict[str, FaissIndex],
 ):
     """
     Insert data into a PostgreSQL database table
-    and update a Faiss index.
+    and update a Faiss index. The insert is queued to the single
+    writer task, which commits concurrent inserts as one group.
+    The vectors are only appended to the index write-ahead log,
+    snapshots are written by the background compaction.
 
     Args:
         data_to_add: A dictionary representing the
@@ -277,26 +1040,10 @@ async def update(
 
         type: A string representing the type of data (resumes or vacancies).
 
-        session: An AsyncSession object representing the database session.
-
         f_indexes: A dictionary containing Faiss indexes
         for different types of data.
 
     Returns:
-        None
+        int: The primary key of the inserted row.
     """
-    _cls, faiss_str_func = TYPE_TABLE[type]
-
-    await insert_data(
-        row=data_to_add,
-        faiss_str=faiss_str_func(data_to_add),
-        table=_cls,
-        session=session,
-        f_index=f_indexes[type][0],
-    )
-
-    for _, v in f_indexes.items():
-        faiss.write_index(v[0], v[1])
-        v[0] = faiss.read_index(v[1])
-
-    await session.commit()
+    return await writer.submit((type, data_to_add, f_indexes[type]))
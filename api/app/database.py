@@ -2,10 +2,10 @@ import os
 
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
-import faiss
 import orjson
 
 import app.config as config
+from app.indexes import FaissIndex
 
 
 class Base(DeclarativeBase):
@@ -37,15 +37,7 @@ engine = create_async_engine(
 )
 async_session_maker = sessionmaker(engine, class_=AsyncSession)
 
-f_index_res = faiss.IndexFlatL2(512)  # hardcoded 384, 512
-if os.path.exists(config.path_to_res_index):
-    f_index_res = faiss.read_index(config.path_to_res_index)
-
-f_index_vac = faiss.IndexFlatL2(512)  # hardcoded
-if os.path.exists(config.path_to_vac_index):
-    f_index_vac = faiss.read_index(config.path_to_vac_index)
-
 fd = {
-    "res": [f_index_res, config.path_to_res_index],
-    "vac": [f_index_vac, config.path_to_vac_index],
+    "res": FaissIndex(config.path_to_res_index),
+    "vac": FaissIndex(config.path_to_vac_index),
 }
@@ -0,0 +1,146 @@
+import asyncio
+import os
+
+import aiohttp
+import numpy as np
+from fastapi import HTTPException
+from fastapi import status
+
+import app.config as config
+
+
+BINARY_MEDIA_TYPE = "application/octet-stream"
+WIRE_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+
+class EmbedderClient:
+    """
+    Application-scoped HTTP client for the embedder service.
+    Keeps a pool of keep-alive connections and retries
+    failed calls with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        pool_size: int,
+        keepalive: float,
+        timeout: float,
+        retries: int,
+        backoff: float,
+        wire_dtype: str,
+    ) -> None:
+        """
+        :param url: Embedder service base url.
+        :param pool_size: Maximum number of simultaneous connections.
+        :param keepalive: Idle connection lifetime, in seconds.
+        :param timeout: Per-call timeout, in seconds.
+        :param retries: Number of retries after the first failed attempt.
+        :param backoff: Delay before the first retry, in seconds.
+        :param wire_dtype: Embedding wire format: "float32" or "float16"
+            for raw bytes, "json" for the JSON fallback.
+        """
+        self.url = url
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.wire_dtype = wire_dtype
+
+        self.headers = {}
+        if wire_dtype in WIRE_DTYPES:
+            self.headers = {
+                "Accept": f"{BINARY_MEDIA_TYPE}, application/json;q=0.9",
+                "X-Embedding-Dtype": wire_dtype,
+            }
+
+        self.session = None
+
+    async def open(self) -> None:
+        """Create the underlying aiohttp session."""
+        if self.session is not None:
+            return
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=self.keepalive
+            ),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self) -> None:
+        """Close the underlying aiohttp session."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @staticmethod
+    async def _decode(resp: aiohttp.ClientResponse, key: str) -> np.ndarray:
+        """
+        Decode embeddings from either a binary or a JSON response.
+        Binary float32 payloads are wrapped without copying.
+        """
+        if resp.content_type != BINARY_MEDIA_TYPE:
+            response = await resp.json()
+            return np.atleast_2d(np.asarray(response[key], dtype="float32"))
+
+        body = await resp.read()
+        embs = np.frombuffer(
+            body, dtype=WIRE_DTYPES[resp.headers["X-Embedding-Dtype"]]
+        ).reshape(
+            int(resp.headers["X-Embedding-Count"]),
+            int(resp.headers["X-Embedding-Dim"]),
+        )
+
+        return embs.astype("float32", copy=False)
+
+    async def _post(self, path: str, payload: dict, key: str) -> np.ndarray:
+        await self.open()
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.session.post(
+                    f"{self.url}{path}", json=payload, headers=self.headers
+                ) as resp:
+                    resp.raise_for_status()
+                    return await self._decode(resp, key)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                client_error = (
+                    isinstance(e, aiohttp.ClientResponseError) and e.status < 500
+                )
+                if client_error or attempt == self.retries:
+                    raise HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail=f"Embedder request failed: {str(e)}",
+                    )
+
+            await asyncio.sleep(self.backoff * 2**attempt)
+
+    async def embed(self, text: str) -> np.ndarray:
+        """
+        Retrieve the float32 embedding vector for a single text.
+
+        :param text: The text to be embedded.
+        """
+        embs = await self._post("/embed", {"text": text}, "query_embedding")
+        return embs[0]
+
+    async def embed_batch(self, texts: list[str]) -> np.ndarray:
+        """
+        Retrieve the float32 embedding matrix for a list of texts.
+
+        :param texts: The texts to be embedded.
+        """
+        return await self._post("/embed_batch", {"texts": texts}, "embeddings")
+
+
+client = EmbedderClient(
+    url=os.getenv("EMBEDDER_URL"),
+    pool_size=config.embedder_pool_size,
+    keepalive=config.embedder_keepalive,
+    timeout=config.embedder_timeout,
+    retries=config.embedder_retries,
+    backoff=config.embedder_backoff,
+    wire_dtype=config.embedder_wire_dtype,
+)
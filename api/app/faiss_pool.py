@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+
+import app.config as config
+
+
+class FaissPool:
+    """
+    Size-bounded thread pool for CPU-bound faiss calls, which release
+    the GIL, so the event loop keeps serving other requests meanwhile.
+    The time calls spend waiting for a thread and computing is tracked
+    separately.
+    """
+
+    def __init__(self, name: str, max_workers: int, omp_threads: int) -> None:
+        """
+        :param name: Thread name prefix.
+        :param max_workers: Number of threads.
+        :param omp_threads: Number of OpenMP threads every pool thread
+            runs faiss with, 0 keeps the faiss default.
+        """
+        self.max_workers = max_workers
+        self.omp_threads = omp_threads
+
+        # The OpenMP thread count is a per-thread setting
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=name,
+            initializer=self._init_thread,
+        )
+
+        self.stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.wait_seconds = 0.0
+        self.compute_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def run(self, fn, *args):
+        """
+        Run a function in the pool and return its result.
+
+        The call always runs to completion: a cancelled caller waits
+        for it before the cancellation is propagated, since callers
+        may hold locks protecting the index the call works on.
+
+        :param fn: The function to run.
+        :param args: Positional arguments of the function.
+        """
+        loop = asyncio.get_running_loop()
+
+        self.in_flight += 1
+        fut = loop.run_in_executor(
+            self.executor, self._timed, time.perf_counter(), fn, *args
+        )
+        fut.add_done_callback(self._on_done)
+
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            await asyncio.wait([fut])
+            raise
+
+    def stats(self) -> dict:
+        """Return the pool size and queue wait vs compute time counters."""
+        calls = max(1, self.calls)
+
+        return {
+            "max_workers": self.max_workers,
+            "omp_threads": self.omp_threads,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "mean_wait_ms": 1000 * self.wait_seconds / calls,
+            "max_wait_ms": 1000 * self.max_wait_seconds,
+            "mean_compute_ms": 1000 * self.compute_seconds / calls,
+        }
+
+    def _init_thread(self) -> None:
+        if self.omp_threads > 0:
+            faiss.omp_set_num_threads(self.omp_threads)
+
+    def _on_done(self, fut: asyncio.Future) -> None:
+        self.in_flight -= 1
+
+    def _timed(self, submitted: float, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            wait = started - submitted
+            with self.stats_lock:
+                self.calls += 1
+                self.wait_seconds += wait
+                self.compute_seconds += time.perf_counter() - started
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+
+# Searches run concurrently, mutations and compaction one at a time
+search_pool = FaissPool(
+    "faiss-search", config.faiss_search_workers, config.faiss_search_omp_threads
+)
+write_pool = FaissPool(
+    "faiss-write", config.faiss_write_workers, config.faiss_write_omp_threads
+)
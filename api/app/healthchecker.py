@@ -38,14 +38,15 @@ class Readiness:
             )
             try:
                 response = requests.get(url=f"{url}", timeout=healthcheck_timeout)
-                if response.status_code:
+                # Only a successful answer means ready, e.g. 503 while loading
+                if response.status_code == 200:
                     cls.logger.info(
                         f"Successfully connected to '{url}'",
                     )
                     break
 
                 cls.logger.warning(
-                    f"Failed to connect to '{url}'",
+                    f"'{url}' is not ready yet: {response.status_code}",
                 )
             except Exception as e:
                 cls.logger.warning(
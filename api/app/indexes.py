@@ -0,0 +1,1225 @@
+import asyncio
+import fcntl
+import json
+import os
+import struct
+import time
+from contextlib import asynccontextmanager
+
+import faiss
+import numpy as np
+
+import app.config as config
+from app.faiss_pool import search_pool, write_pool
+from app.vectors import VectorStore
+
+
+# Vector storage codecs (ignored by IVF-PQ, which has its own codes)
+STORAGE_CODECS = {"float32": "Flat", "fp16": "SQfp16", "sq8": "SQ8"}
+STORAGE_QTYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def needs_training(index_type: str, storage: str) -> bool:
+    """
+    Check whether an index has to be trained before vectors can be added.
+
+    :param index_type: One of "flat", "ivf_flat", "ivf_pq", "hnsw".
+    :param storage: One of "float32", "fp16", "sq8".
+    """
+    return index_type in ("ivf_flat", "ivf_pq") or storage == "sq8"
+
+
+def index_factory_string(index_type: str, storage: str, n_train: int = 0) -> str:
+    """
+    Build a faiss index factory string for the configured index type.
+
+    :param index_type: One of "flat", "ivf_flat", "ivf_pq", "hnsw".
+    :param storage: One of "float32", "fp16", "sq8".
+    :param n_train: Number of training vectors. The number of IVF lists
+        is clamped, so that every list gets enough training points.
+    """
+    params = config.index_params.get(index_type, {})
+    codec = STORAGE_CODECS[storage]
+
+    if index_type == "flat":
+        return codec
+
+    if index_type == "hnsw":
+        return f"HNSW{params['m']},{codec}"
+
+    nlist = max(1, min(params["nlist"], n_train // 39))
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},{codec}"
+
+    if index_type == "ivf_pq":
+        return f"IVF{nlist},PQ{params['m']}x{params['nbits']}"
+
+    raise ValueError(f"Unknown index type '{index_type}'")
+
+
+def create_index(
+    dim: int,
+    index_type: str,
+    storage: str,
+    train_vectors: np.ndarray | None = None,
+) -> faiss.Index:
+    """
+    Create an empty faiss index of the given type.
+
+    Indexes, which require training, are returned as a flat
+    (exact) index until `train_vectors` are provided.
+
+    :param dim: Vectors dimension.
+    :param index_type: One of "flat", "ivf_flat", "ivf_pq", "hnsw".
+    :param storage: One of "float32", "fp16", "sq8".
+    :param train_vectors: Sample of vectors to train the quantizer on.
+    """
+    if needs_training(index_type, storage) and train_vectors is None:
+        return faiss.IndexFlatL2(dim)
+
+    n_train = 0 if train_vectors is None else len(train_vectors)
+    index = faiss.index_factory(
+        dim, index_factory_string(index_type, storage, n_train), faiss.METRIC_L2
+    )
+
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = config.index_params["hnsw"]["ef_construction"]
+
+    if not index.is_trained:
+        index.train(train_vectors)
+
+    # Otherwise it would be reported as not built and never served as built
+    if not is_index_type(index, index_type, storage):
+        raise ValueError(
+            f"Created index {type(index).__name__} is not recognized "
+            f"as {index_type} ({storage})"
+        )
+
+    return index
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: str,
+    storage: str,
+    reduction: str | None,
+    chunk_size: int = 65536,
+) -> tuple:
+    """
+    Build an index of the given type over all vectors, training the
+    quantizer and the optional reduction on a sample of them. Vectors
+    are added in chunks, so they may be a memory-mapped array.
+
+    Below `config.index_train_min` vectors an index, which has to be
+    trained, is built as a flat index instead.
+
+    :param vectors: float32 array of shape (n, dim), row i is id i.
+    :param index_type: One of "flat", "ivf_flat", "ivf_pq", "hnsw".
+    :param storage: One of "float32", "fp16", "sq8".
+    :param reduction: One of None, "pca", "opq".
+
+    Returns:
+        tuple: The index, the reduction transform and its recall report
+        (both None without reduction).
+    """
+    ntotal, dim = vectors.shape
+    trained = reduction is not None or needs_training(index_type, storage)
+
+    if trained and ntotal < config.index_train_min:
+        index = faiss.IndexFlatL2(dim)
+        for start in range(0, ntotal, chunk_size):
+            index.add(np.ascontiguousarray(vectors[start : start + chunk_size]))
+        return index, None, None
+
+    train_vectors = None
+    if trained:
+        sample = np.random.default_rng(0).choice(
+            ntotal, size=min(ntotal, config.index_train_size), replace=False
+        )
+        train_vectors = np.ascontiguousarray(vectors[np.sort(sample)])
+
+    transform, report = None, None
+    if reduction is not None:
+        transform = create_transform(dim, reduction, train_vectors)
+        report = reduction_recall(transform, vectors, config.topn)
+        train_vectors = transform.apply(train_vectors)
+
+    index = create_index(
+        dim if transform is None else transform.d_out,
+        index_type,
+        storage,
+        train_vectors,
+    )
+    for start in range(0, ntotal, chunk_size):
+        chunk = np.ascontiguousarray(vectors[start : start + chunk_size])
+        index.add(chunk if transform is None else transform.apply(chunk))
+
+    return index, transform, report
+
+
+def _has_storage(index: faiss.Index, storage: str) -> bool:
+    # Expects a downcast index: flat codes, or the (IVF) scalar quantizer
+    # codes of the fp16 and sq8 storages
+    if storage == "float32":
+        return isinstance(index, (faiss.IndexFlat, faiss.IndexIVFFlat))
+
+    if not isinstance(
+        index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)
+    ):
+        return False
+
+    return index.sq.qtype == STORAGE_QTYPES[storage]
+
+
+def is_index_type(index: faiss.Index, index_type: str, storage: str) -> bool:
+    """
+    Check whether a (possibly loaded from disk) index
+    is of the given type and vector storage.
+
+    :param index: Faiss index object.
+    :param index_type: One of "flat", "ivf_flat", "ivf_pq", "hnsw".
+    :param storage: One of "float32", "fp16", "sq8".
+    """
+    if isinstance(index, MmapFlatIndex):
+        return index_type == "flat" and storage == "float32"
+
+    # The extracted IVF index is a base class proxy until downcast
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf = faiss.downcast_index(ivf)
+    hnsw = isinstance(index, faiss.IndexHNSW)
+
+    if index_type == "flat":
+        return ivf is None and not hnsw and _has_storage(index, storage)
+
+    if index_type == "hnsw":
+        return hnsw and _has_storage(faiss.downcast_index(index.storage), storage)
+
+    if index_type == "ivf_flat":
+        return isinstance(
+            ivf, (faiss.IndexIVFFlat, faiss.IndexIVFScalarQuantizer)
+        ) and _has_storage(ivf, storage)
+
+    if index_type == "ivf_pq":
+        return isinstance(ivf, faiss.IndexIVFPQ)
+
+    return False
+
+
+def index_nbytes(index: faiss.Index) -> int:
+    """
+    Estimate the memory used by the index: vector codes
+    plus ids, centroids and graph links where present.
+
+    :param index: Faiss index object.
+    """
+    if isinstance(index, MmapFlatIndex):
+        return index.xb.nbytes
+
+    if isinstance(index, faiss.IndexHNSW):
+        hnsw = index.hnsw
+        links = hnsw.neighbors.size() * 4 + hnsw.offsets.size() * 8
+        return index_nbytes(faiss.downcast_index(index.storage)) + links
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        centroids = ivf.nlist * ivf.d * 4
+        return ivf.ntotal * (ivf.code_size + 8) + centroids
+
+    return index.ntotal * index.sa_code_size()
+
+
+def search_params(
+    index: faiss.Index,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    sel: faiss.IDSelector | None = None,
+):
+    """
+    Build per-request search parameters for the index type.
+
+    :param index: Faiss index object.
+    :param nprobe: Number of IVF lists to scan, config default if None.
+    :param ef_search: HNSW search queue size, config default if None.
+    :param sel: Optional selector of the ids allowed in the results.
+    """
+    if isinstance(index, MmapFlatIndex):
+        return None
+
+    if faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe or config.nprobe, sel=sel)
+
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(
+            efSearch=ef_search or config.ef_search, sel=sel
+        )
+
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+
+    return None
+
+
+def id_selector(mask: np.ndarray) -> tuple:
+    """
+    Build a faiss selector of the ids set in a boolean mask.
+
+    :param mask: Boolean array indexed by id.
+
+    Returns:
+        tuple: The selector and its bitmap, which has to be kept
+        alive for as long as the selector is used.
+    """
+    bitmap = np.packbits(mask, bitorder="little")
+
+    return faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap)), bitmap
+
+
+def filtered_search(
+    index: faiss.Index,
+    vectors: np.ndarray,
+    k: int,
+    mask: np.ndarray,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Search the k nearest neighbors among the ids set in the mask.
+    The filter is applied during the scan, so k results are returned
+    whenever at least k ids match: approximate indexes, which found
+    fewer, are searched again exhaustively.
+
+    :param index: Faiss index object.
+    :param vectors: float32 array of shape (n, d).
+    :param k: Number of neighbors.
+    :param mask: Boolean array of length index.ntotal.
+    :param nprobe: Number of IVF lists to scan.
+    :param ef_search: HNSW search queue size.
+    """
+    if isinstance(index, MmapFlatIndex):
+        return index.search(vectors, k, ids=np.flatnonzero(mask))
+
+    sel, bitmap = id_selector(mask)
+    distances, ids = index.search(
+        vectors, k, params=search_params(index, nprobe, ef_search, sel)
+    )
+
+    expected = min(k, int(np.count_nonzero(mask)))
+    if (np.count_nonzero(ids >= 0, axis=1) >= expected).all():
+        return distances, ids
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        nprobe = ivf.nlist
+    elif isinstance(index, faiss.IndexHNSW):
+        ef_search = max(ef_search or config.ef_search, index.ntotal)
+    else:
+        return distances, ids
+
+    return index.search(
+        vectors, k, params=search_params(index, nprobe, ef_search, sel)
+    )
+
+
+def create_transform(
+    dim: int, reduction: str, train_vectors: np.ndarray
+) -> faiss.VectorTransform:
+    """
+    Train a dimensionality-reduction transform.
+
+    :param dim: Input vectors dimension.
+    :param reduction: One of "pca", "opq".
+    :param train_vectors: Sample of vectors to train the transform on.
+    """
+    if reduction == "pca":
+        transform = faiss.PCAMatrix(dim, config.reduction_dim)
+    elif reduction == "opq":
+        transform = faiss.OPQMatrix(
+            dim, config.reduction_opq_m, config.reduction_dim
+        )
+    else:
+        raise ValueError(f"Unknown reduction '{reduction}'")
+
+    transform.train(train_vectors)
+
+    return transform
+
+
+def reduction_recall(
+    transform: faiss.VectorTransform, vectors: np.ndarray, k: int
+) -> dict:
+    """
+    Measure how much recall@k the reduction costs: the neighbors of a
+    sample of stored vectors found by exact search in the reduced space
+    are compared with the exact neighbors in the original space.
+
+    :param transform: Trained transform.
+    :param vectors: Stored document vectors.
+    :param k: Number of neighbors.
+    """
+    queries = vectors[
+        np.random.default_rng(1).choice(
+            len(vectors), size=min(len(vectors), 1000), replace=False
+        )
+    ]
+
+    full = faiss.IndexFlatL2(vectors.shape[1])
+    full.add(np.ascontiguousarray(vectors))
+    _, expected = full.search(queries, k)
+
+    reduced = faiss.IndexFlatL2(transform.d_out)
+    reduced.add(transform.apply(np.ascontiguousarray(vectors)))
+    _, found = reduced.search(transform.apply(queries), k)
+
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+
+    return {
+        "d_in": transform.d_in,
+        "d_out": transform.d_out,
+        "k": k,
+        "queries": len(queries),
+        "recall": hits / (len(queries) * k),
+    }
+
+
+# Distance faiss reports for missing results
+MISSING_DISTANCE = np.finfo("float32").max
+
+# Write-ahead log record header: p_id (int64) and vector dimension (uint32)
+WAL_HEADER = struct.Struct("<qI")
+
+
+def atomic_write(write_fn, path: str) -> None:
+    """
+    Write a file through a temporary file and an atomic rename,
+    so readers never see a partially written file.
+
+    :param write_fn: A function writing the file to a given path.
+    :param path: Destination path.
+    """
+    tmp_path = f"{path}.tmp"
+    write_fn(tmp_path)
+    os.replace(tmp_path, path)
+
+
+@asynccontextmanager
+async def interprocess_lock(path: str):
+    """
+    Exclusive lock shared by all processes (e.g. uvicorn workers)
+    using the same lock file. Waiting happens in a thread.
+
+    :param path: Path of the lock file.
+    """
+    with open(path, "a") as f:
+        await asyncio.to_thread(fcntl.flock, f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class ReadWriteLock:
+    """
+    Asyncio lock letting in either any number of readers or a single
+    writer. Waiting writers keep new readers out, so mutations of a
+    busy index are not starved.
+    """
+
+    def __init__(self) -> None:
+        self.cond = asyncio.Condition()
+        self.readers = 0
+        self.writing = False
+        self.writers_waiting = 0
+
+    @asynccontextmanager
+    async def read(self):
+        """Hold the lock shared."""
+        async with self.cond:
+            await self.cond.wait_for(
+                lambda: not self.writing and not self.writers_waiting
+            )
+            self.readers += 1
+        try:
+            yield
+        finally:
+            async with self.cond:
+                self.readers -= 1
+                self.cond.notify_all()
+
+    @asynccontextmanager
+    async def write(self):
+        """Hold the lock exclusively."""
+        async with self.cond:
+            self.writers_waiting += 1
+            try:
+                await self.cond.wait_for(
+                    lambda: not self.writing and not self.readers
+                )
+            finally:
+                self.writers_waiting -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            async with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+
+def read_generation(path: str) -> int:
+    """
+    Read the snapshot generation counter, 0 if there is none yet.
+
+    :param path: Path of the generation file.
+    """
+    try:
+        with open(path) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def write_generation(path: str, generation: int) -> None:
+    """
+    Atomically write the snapshot generation counter.
+
+    :param path: Path of the generation file.
+    :param generation: New generation.
+    """
+
+    def write(p):
+        with open(p, "w") as f:
+            f.write(str(generation))
+
+    atomic_write(write, path)
+
+
+def increment_counter(path: str) -> int:
+    """
+    Increment a counter file shared by all processes.
+
+    :param path: Path of the counter file, read by `read_generation`.
+
+    Returns:
+        int: The new counter value.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            value = int(os.pread(fd, 32, 0) or 0) + 1
+        except ValueError:
+            value = 1
+
+        # Fixed width and never shorter, so readers never see a torn number
+        os.pwrite(fd, f"{value:020d}".encode(), 0)
+    finally:
+        # Closing releases the lock
+        os.close(fd)
+
+    return value
+
+
+async def compact_periodically(f_indexes: dict, interval: float) -> None:
+    """
+    Background task folding the write-ahead logs into new snapshots.
+
+    :param f_indexes: A dictionary of FaissIndex objects.
+    :param interval: Time between compactions, in seconds.
+    """
+    while True:
+        await asyncio.sleep(interval)
+
+        for f_index in f_indexes.values():
+            await f_index.compact()
+
+
+class MmapFlatIndex:
+    """
+    Read-only exact L2 index over a memory-mapped .npy file of
+    float32 vectors. The vectors live in the page cache, which is
+    shared by all processes mapping the same file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Path of the .npy vectors file.
+        """
+        self.xb = np.load(path, mmap_mode="r")
+        self.ntotal, self.d = self.xb.shape
+
+    def search(self, vectors: np.ndarray, k: int, params=None, ids=None):
+        """
+        Search the k nearest neighbors of the query vectors.
+
+        :param vectors: float32 array of shape (n, d).
+        :param k: Number of neighbors.
+        :param params: Unused, kept for faiss compatibility.
+        :param ids: Optional sorted array of the ids to search among.
+        """
+        xb = self.xb if ids is None else self.xb[ids]
+
+        distances = np.full((len(vectors), k), MISSING_DISTANCE, dtype="float32")
+        labels = np.full((len(vectors), k), -1, dtype="int64")
+
+        found = min(k, len(xb))
+        if found:
+            distances[:, :found], labels[:, :found] = faiss.knn(vectors, xb, found)
+            if ids is not None:
+                labels[:, :found] = ids[labels[:, :found]]
+
+        return distances, labels
+
+    def to_index(self) -> faiss.IndexFlatL2:
+        """Copy the vectors into a writable in-memory flat index."""
+        index = faiss.IndexFlatL2(self.d)
+        index.add(np.asarray(self.xb))
+
+        return index
+
+
+def load_snapshot(path: str, mmap: bool):
+    """
+    Load an index snapshot, None if there is none yet.
+
+    In mmap mode a flat snapshot is opened from its raw .npy vectors
+    file, other snapshots are read with the faiss mmap IO flags
+    (which map the inverted lists of IVF indexes).
+
+    :param path: Path of the index snapshot.
+    :param mmap: Whether to memory-map the snapshot read-only.
+    """
+    npy_path = f"{os.path.splitext(path)[0]}.npy"
+    if mmap and os.path.exists(npy_path):
+        return MmapFlatIndex(npy_path)
+
+    if not os.path.exists(path):
+        return None
+
+    if mmap:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+    return faiss.read_index(path)
+
+
+def write_flat_vectors(index: faiss.IndexFlat, path: str) -> None:
+    """
+    Write the vectors of a flat index as a .npy file without copying them.
+
+    :param index: Flat float32 faiss index.
+    :param path: Destination path.
+    """
+    xb = np.empty((0, index.d), dtype="float32")
+    if index.ntotal:
+        xb = faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d)
+        xb = xb.reshape(index.ntotal, index.d)
+
+    with open(path, "wb") as f:
+        np.save(f, xb)
+
+
+def merge_results(results: list, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Merge (distances, ids) search results of several indexes.
+
+    :param results: A list of (distances, ids) tuples.
+    :param k: Number of neighbors to keep.
+    """
+    distances = np.hstack([d for d, _ in results])
+    ids = np.hstack([i for _, i in results])
+
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+
+    return (
+        np.take_along_axis(distances, order, axis=1),
+        np.take_along_axis(ids, order, axis=1),
+    )
+
+
+def resident_bytes() -> int | None:
+    """Resident set size of the current process (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class FaissIndex:
+    """
+    Faiss index together with the path of its snapshot
+    and a version number, which is increased every time
+    the rows of added vectors are committed (by any process,
+    see `mark_committed`) or a new snapshot is picked up.
+
+    Indexes, which have to be trained, are served by an exact flat
+    index until it holds `config.index_train_min` vectors. Then the
+    configured index (and the optional PCA/OPQ reduction, which is
+    applied to both inserted and query vectors) is trained on
+    a sample of them and replaces it.
+
+    Inserted vectors are appended to a write-ahead log next to the
+    snapshot, which is replayed on startup. The snapshot itself is
+    rewritten only by compaction, which runs in a background thread.
+
+    In mmap mode the snapshot is mapped read-only and new vectors are
+    kept in a small in-memory delta index until the next compaction,
+    which also is the only place where the index gets trained.
+
+    Every inserted vector is also kept in a `VectorStore` next to the
+    snapshot (with `config.vector_store`), so the index can be rebuilt
+    from the stored vectors, e.g. as another type, without re-embedding.
+
+    Several processes may serve the same index: all mutations (inserts,
+    compaction) take an inter-process lock, and every process tails the
+    write-ahead log and reopens the snapshot when its generation
+    counter changes, so writes of one worker become visible to all.
+
+    Faiss calls run in the thread pools of `app.faiss_pool`, never
+    in the event loop. Within a process searches run concurrently,
+    while changes of the in-memory index wait for them to finish.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        index_type: str = config.index_type,
+        storage: str = config.index_storage,
+        reduction: str | None = config.reduction,
+        mmap: bool = config.index_mmap,
+    ) -> None:
+        """
+        :param path: Path of the index snapshot on disk.
+        :param index_type: Target index type from the config.
+        :param storage: Target vector storage from the config.
+        :param reduction: Target dimensionality reduction from the config.
+        :param mmap: Whether to memory-map the snapshot read-only.
+        """
+        self.path = path
+        self.index_type = index_type
+        self.storage = storage
+        self.reduction = reduction
+        self.mmap = mmap
+        self.version = 0
+
+        # The reduction, log and raw vectors are stored next to the snapshot
+        base_path = os.path.splitext(path)[0]
+        self.npy_path = f"{base_path}.npy"
+        self.transform_path = f"{base_path}.vt"
+        self.report_path = f"{self.transform_path}.json"
+        self.wal_path = f"{base_path}.wal"
+        self.gen_path = f"{base_path}.gen"
+        self.commits_path = f"{base_path}.commits"
+        self.lock_path = f"{base_path}.lock"
+        self.vectors = VectorStore(f"{base_path}.vectors", config.embedding_dim)
+
+        # Held by inserts and compaction, searches never wait for it
+        self.lock = asyncio.Lock()
+        # Shared by searches, exclusive for changes of the in-memory index
+        self.rw = ReadWriteLock()
+        self.compaction = None
+
+        self.generation = read_generation(self.gen_path)
+        self.commits = read_generation(self.commits_path)
+        self._open()
+        self._reset_log()
+        self._tail_log()
+        self.last_refresh = time.monotonic()
+
+    @property
+    def ntotal(self) -> int:
+        """Number of vectors in the index."""
+        if self.delta is None:
+            return self.index.ntotal
+
+        return self.index.ntotal + self.delta.ntotal
+
+    def add(self, vectors: np.ndarray) -> None:
+        """
+        Add vectors to the index, rebuilding it as the configured
+        index type once there is enough data to train it.
+
+        :param vectors: float32 array of shape (n, dim).
+        """
+        vectors = self._apply_transform(vectors)
+
+        if self.delta is not None:
+            self.delta.add(vectors)
+            return
+
+        self.index.add(vectors)
+        self.index, self.transform, self.reduction_report = self._rebuild(
+            self.index, self.transform, self.reduction_report
+        )
+
+    @asynccontextmanager
+    async def write_lock(self):
+        """
+        Serialize mutations of this index across coroutines and processes.
+        The index is brought up to date once the lock is taken.
+        """
+        async with self.lock:
+            async with interprocess_lock(self.lock_path):
+                await self.refresh()
+                yield
+
+    async def insert(self, vectors: np.ndarray, compact: bool = True) -> list[int]:
+        """
+        Durably add vectors: append them to the write-ahead log,
+        then to the index.
+
+        :param vectors: float32 array of shape (n, dim).
+        :param compact: Whether to start a compaction once the log
+            is long enough, bulk loads save the index themselves.
+
+        Returns:
+            list[int]: The allocated ids (faiss positions) of the vectors.
+        """
+        async with self.write_lock():
+            p_ids = list(range(self.ntotal, self.ntotal + len(vectors)))
+            await write_pool.run(self._append_log, p_ids, vectors)
+            if config.vector_store:
+                await write_pool.run(self.vectors.append, p_ids, vectors)
+            await self.refresh()
+
+        if compact and self.wal_records >= config.wal_compact_records:
+            self.schedule_compaction()
+
+        return p_ids
+
+    async def refresh(self) -> None:
+        """
+        Pick up a new snapshot generation and log records
+        written by other processes (or by this one).
+        """
+        self.last_refresh = time.monotonic()
+
+        # Vectors are logged before their rows are committed, so cached
+        # results are invalidated by the commit counter, not by the log
+        commits = read_generation(self.commits_path)
+        if commits != self.commits:
+            self.commits = commits
+            self.bump_version()
+
+        if not self._is_stale():
+            return
+
+        generation = self.generation
+        async with self.rw.write():
+            await write_pool.run(self._refresh)
+
+        # A new snapshot may change the results of approximate indexes
+        if self.generation != generation:
+            self.bump_version()
+
+    async def mark_committed(self) -> None:
+        """
+        Signal all processes that the rows of added vectors were
+        committed, so their cached results of this index become stale.
+        """
+        self.commits = await asyncio.to_thread(increment_counter, self.commits_path)
+        self.bump_version()
+
+    async def maybe_refresh(self) -> None:
+        """Refresh at most once per `config.index_refresh_interval`."""
+        # The lock owner keeps the index up to date itself
+        if self.lock.locked():
+            return
+
+        if time.monotonic() - self.last_refresh >= config.index_refresh_interval:
+            await self.refresh()
+
+    async def search(
+        self,
+        vectors: np.ndarray,
+        k: int,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        mask: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Search the k nearest neighbors of the query vectors.
+
+        :param vectors: float32 array of shape (n, dim).
+        :param k: Number of neighbors.
+        :param nprobe: Number of IVF lists to scan.
+        :param ef_search: HNSW search queue size.
+        :param mask: Optional boolean array of the ids allowed in the
+            results, ids past its end are not allowed.
+        """
+        await self.maybe_refresh()
+
+        async with self.rw.read():
+            return await search_pool.run(
+                self._search, vectors, k, nprobe, ef_search, mask
+            )
+
+    def _search(
+        self,
+        vectors: np.ndarray,
+        k: int,
+        nprobe: int | None,
+        ef_search: int | None,
+        mask: np.ndarray | None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        index, delta = self.index, self.delta
+        vectors = self._apply_transform(vectors)
+
+        if mask is not None and len(mask) != self.ntotal:
+            padded = np.zeros(self.ntotal, dtype=bool)
+            n = min(len(mask), self.ntotal)
+            padded[:n] = mask[:n]
+            mask = padded
+
+        if mask is None:
+            params = search_params(index, nprobe, ef_search)
+            result = index.search(vectors, k, params=params)
+        else:
+            result = filtered_search(
+                index, vectors, k, mask[: index.ntotal], nprobe, ef_search
+            )
+
+        if delta is None or delta.ntotal == 0:
+            return result
+
+        if mask is None:
+            distances, ids = delta.search(vectors, k)
+        else:
+            distances, ids = filtered_search(
+                delta, vectors, k, mask[index.ntotal :]
+            )
+        ids = np.where(ids >= 0, ids + index.ntotal, -1)
+
+        return merge_results([result, (distances, ids)], k)
+
+    async def save(self) -> None:
+        """
+        Atomically write the index snapshot and the reduction
+        next to it, then drop the write-ahead log it covers.
+        """
+        async with self.write_lock():
+            generation = await write_pool.run(self._write_snapshot)
+
+            async with self.rw.write():
+                await write_pool.run(self._after_snapshot, generation)
+
+    async def compact(self) -> None:
+        """
+        Fold the write-ahead log into a new snapshot. The snapshot is
+        written in the write pool, inserts wait for it to finish.
+        """
+        async with self.write_lock():
+            if self.wal_records == 0:
+                return
+
+            # Searches go on meanwhile, the snapshot only reads the index
+            generation = await write_pool.run(self._write_snapshot)
+
+            async with self.rw.write():
+                await write_pool.run(self._after_snapshot, generation)
+
+    async def rebuild(self, vectors: np.ndarray) -> None:
+        """
+        Replace the index by the configured index type built from the
+        given vectors, which have to cover all the current ids. The new
+        snapshot is written like a compaction one, so other processes
+        pick it up by its generation.
+
+        :param vectors: float32 array of shape (n, dim), row i is id i.
+        """
+        async with self.write_lock():
+            if len(vectors) < self.ntotal:
+                raise ValueError(
+                    f"{self.path}: {len(vectors)} vectors given, "
+                    f"but the index holds {self.ntotal}"
+                )
+
+            built = await write_pool.run(
+                build_index, vectors, self.index_type, self.storage, self.reduction
+            )
+            generation = await write_pool.run(self._write_files, *built)
+
+            async with self.rw.write():
+                if not self.mmap:
+                    self.index, self.transform, self.reduction_report = built
+                await write_pool.run(self._after_snapshot, generation)
+
+        self.bump_version()
+
+    async def clear(self) -> None:
+        """
+        Remove all the vectors of the index: its snapshot, write-ahead
+        log and stored vectors, e.g. after a failed bulk load.
+        """
+        async with self.write_lock():
+            generation = await write_pool.run(self._remove_files)
+
+            async with self.rw.write():
+                self.generation = generation
+                await write_pool.run(self._open)
+                self._reset_log()
+
+        self.bump_version()
+
+    def schedule_compaction(self) -> None:
+        """Start a background compaction unless one is running."""
+        if self.compaction is None or self.compaction.done():
+            self.compaction = asyncio.create_task(self.compact())
+
+    def bump_version(self) -> None:
+        """Mark the index content as changed."""
+        self.version += 1
+
+    def stats(self) -> dict:
+        """Report the index type and its memory footprint."""
+        nbytes = index_nbytes(self.index)
+        if self.delta is not None:
+            nbytes += index_nbytes(self.delta)
+
+        return {
+            "index_type": self.index_type,
+            "storage": self.storage,
+            "reduction": self.reduction,
+            "built": self._is_built(self.index, self.transform),
+            "mmap": self.mmap,
+            "dim": self.index.d,
+            "ntotal": self.ntotal,
+            "delta_ntotal": 0 if self.delta is None else self.delta.ntotal,
+            "generation": self.generation,
+            "bytes": nbytes,
+            "bytes_per_vector": nbytes / max(1, self.ntotal),
+            "load_seconds": self.load_seconds,
+            "reduction_report": self.reduction_report,
+            "stored_vectors": self.vectors.stats(),
+        }
+
+    def _is_stale(self) -> bool:
+        if read_generation(self.gen_path) != self.generation:
+            return True
+
+        try:
+            st = os.stat(self.wal_path)
+        except FileNotFoundError:
+            return False
+
+        return st.st_ino != self.wal_inode or st.st_size > self.wal_offset
+
+    def _refresh(self) -> bool:
+        generation = read_generation(self.gen_path)
+        changed = generation != self.generation
+        if changed:
+            self.generation = generation
+            self._open()
+            self._reset_log()
+
+        return self._tail_log() or changed
+
+    def _open(self) -> None:
+        start = time.perf_counter()
+
+        index = load_snapshot(self.path, self.mmap)
+        if index is None:
+            index = create_index(config.embedding_dim, self.index_type, self.storage)
+
+        transform = None
+        if os.path.exists(self.transform_path):
+            transform = faiss.read_VectorTransform(self.transform_path)
+            # A stale reduction of a deleted snapshot must not be applied
+            if transform.d_out != index.d:
+                transform = None
+
+        report = None
+        if os.path.exists(self.report_path):
+            with open(self.report_path) as f:
+                report = json.load(f)
+
+        delta = None
+        if self.mmap:
+            delta = faiss.IndexFlatL2(index.d)
+        else:
+            index, transform, report = self._rebuild(index, transform, report)
+
+        self.index, self.transform, self.delta = index, transform, delta
+        self.reduction_report = report
+        self.load_seconds = time.perf_counter() - start
+
+    def _materialize(self) -> tuple:
+        if not self.mmap:
+            return self.index, self.transform, self.reduction_report
+
+        # A private writable copy of the mapped snapshot with the delta added
+        if isinstance(self.index, MmapFlatIndex):
+            index = self.index.to_index()
+        elif os.path.exists(self.path):
+            index = faiss.read_index(self.path)
+        else:
+            index = faiss.clone_index(self.index)
+
+        if self.delta.ntotal:
+            index.add(self.delta.reconstruct_n(0, self.delta.ntotal))
+
+        return self._rebuild(index, self.transform, self.reduction_report)
+
+    def _write_snapshot(self) -> int:
+        return self._write_files(*self._materialize())
+
+    def _write_files(self, index, transform, report) -> int:
+        # The reduction goes first: a snapshot is never newer than it
+        if transform is not None:
+            atomic_write(
+                lambda p: faiss.write_VectorTransform(transform, p),
+                self.transform_path,
+            )
+
+        if report is not None:
+            with open(self.report_path, "w") as f:
+                json.dump(report, f)
+
+        if self.mmap and is_index_type(index, "flat", "float32"):
+            atomic_write(lambda p: write_flat_vectors(index, p), self.npy_path)
+        elif os.path.exists(self.npy_path):
+            # Never leave raw vectors older than the snapshot behind
+            os.remove(self.npy_path)
+
+        atomic_write(lambda p: faiss.write_index(index, p), self.path)
+
+        # A reduction the snapshot no longer uses must not be applied
+        if transform is None and os.path.exists(self.transform_path):
+            os.remove(self.transform_path)
+
+        # Other processes reload the snapshot once they see the new generation
+        generation = self.generation + 1
+        write_generation(self.gen_path, generation)
+
+        if os.path.exists(self.wal_path):
+            os.remove(self.wal_path)
+
+        return generation
+
+    def _remove_files(self) -> int:
+        paths = [self.wal_path, self.vectors.path, self.vectors.ids_path]
+        paths += [self.path, self.npy_path, self.transform_path, self.report_path]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+        # Other processes drop the vectors once they see the new generation
+        generation = self.generation + 1
+        write_generation(self.gen_path, generation)
+
+        return generation
+
+    def _after_snapshot(self, generation: int) -> None:
+        self.generation = generation
+        self._reset_log()
+
+        if self.mmap:
+            self._open()
+
+    def _append_log(self, p_ids: list[int], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+
+        with open(self.wal_path, "ab") as f:
+            for p_id, vector in zip(p_ids, vectors):
+                f.write(WAL_HEADER.pack(p_id, len(vector)))
+                f.write(vector.tobytes())
+
+            f.flush()
+            if config.wal_fsync:
+                os.fsync(f.fileno())
+
+    def _reset_log(self) -> None:
+        self.wal_inode = None
+        self.wal_offset = 0
+        self.wal_records = 0
+
+    def _tail_log(self, reopen: bool = True) -> bool:
+        try:
+            f = open(self.wal_path, "rb")
+        except FileNotFoundError:
+            return False
+
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != self.wal_inode:
+                self._reset_log()
+                self.wal_inode = inode
+
+            f.seek(self.wal_offset)
+            data = f.read()
+
+        vectors = []
+        offset = 0
+        while offset + WAL_HEADER.size <= len(data):
+            p_id, dim = WAL_HEADER.unpack_from(data, offset)
+
+            # A torn (or still being written) record is picked up later
+            end = offset + WAL_HEADER.size + dim * 4
+            if end > len(data):
+                break
+
+            next_id = self.ntotal + len(vectors)
+            if p_id > next_id:
+                # Records are missing: a newer snapshot was written meanwhile
+                if not reopen:
+                    break
+                self.generation = read_generation(self.gen_path)
+                self._open()
+                self._reset_log()
+                return self._tail_log(reopen=False)
+
+            # Records already covered by the snapshot are skipped
+            if p_id == next_id:
+                vectors.append(
+                    np.frombuffer(
+                        data, dtype="<f4", count=dim, offset=offset + WAL_HEADER.size
+                    )
+                )
+
+            offset = end
+            self.wal_records += 1
+
+        self.wal_offset += offset
+
+        if vectors:
+            self.add(np.vstack(vectors))
+
+        return bool(vectors)
+
+    def _apply_transform(self, vectors: np.ndarray) -> np.ndarray:
+        if self.transform is None:
+            return vectors
+
+        return self.transform.apply(vectors)
+
+    def _is_built(self, index, transform) -> bool:
+        if not is_index_type(index, self.index_type, self.storage):
+            return False
+
+        return self.reduction is None or transform is not None
+
+    def _rebuild(self, index, transform, report) -> tuple:
+        if self._is_built(index, transform):
+            return index, transform, report
+
+        # An already built index of another type is served as is,
+        # it has to be rebuilt explicitly (`app.reindex`) to change its type
+        if transform is not None or not isinstance(index, faiss.IndexFlat):
+            return index, transform, report
+
+        trained = self.reduction is not None or needs_training(
+            self.index_type, self.storage
+        )
+
+        if trained and index.ntotal < config.index_train_min:
+            return index, transform, report
+
+        return build_index(
+            index.reconstruct_n(0, index.ntotal),
+            self.index_type,
+            self.storage,
+            self.reduction,
+        )
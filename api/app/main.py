@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 import os
@@ -7,22 +8,70 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
 from app import database
-from app.dao import init_db
+from app import embedder_client
+from app.dao import (
+    init_db,
+    load_built_data,
+    search_batchers,
+    sync_attributes,
+    upgrade_typed_columns,
+    writer,
+)
+from app.indexes import compact_periodically, interprocess_lock, resident_bytes
+import app.config as config
 import app.healthchecker as hc
 from app.router import router
 
 
 @asynccontextmanager
 async def init_tables(app: FastAPI):
-    hc.Readiness(urls=[os.getenv("EMBEDDER_URL")], logger=app.state.Logger).run()
+    hc.Readiness(
+        urls=[f"{os.getenv('EMBEDDER_URL')}/ready"], logger=app.state.Logger
+    ).run()
+    await embedder_client.client.open()
+
+    # Init DB tables if not exist, only one worker seeds the data
+    async with interprocess_lock(config.seed_lock_path):
+        for f_index in database.fd.values():
+            await f_index.refresh()
+
+        async with database.engine.begin() as conn:
+            await conn.run_sync(database.Base.metadata.create_all)
+            await upgrade_typed_columns(conn)
+            await load_built_data(conn, database.fd)
+            await init_db(conn, database.fd)
+
+    # Attribute filters are evaluated over an in-memory copy of the columns
+    async with database.async_session_maker() as session:
+        for type, f_index in database.fd.items():
+            await sync_attributes(type, session, f_index.ntotal)
+
+    for type, f_index in database.fd.items():
+        stats = f_index.stats()
+        app.state.Logger.info(
+            f"Index '{type}' ({stats['index_type']}, {stats['storage']}): "
+            f"{stats['ntotal']} vectors, {stats['bytes']} bytes "
+            f"({stats['bytes_per_vector']:.0f} per vector), "
+            f"{'mapped' if stats['mmap'] else 'loaded'} "
+            f"in {stats['load_seconds']:.3f}s"
+        )
+    app.state.Logger.info(f"Process resident size: {resident_bytes()} bytes")
 
-    # Init DB tables if not exist
-    async with database.engine.begin() as conn:
-        await conn.run_sync(database.Base.metadata.create_all)
-        await init_db(conn, database.fd)
+    compaction = asyncio.create_task(
+        compact_periodically(database.fd, config.wal_compact_interval)
+    )
 
     yield
 
+    await writer.stop()
+    for batcher in search_batchers.values():
+        await batcher.stop()
+    compaction.cancel()
+    for f_index in database.fd.values():
+        await f_index.compact()
+
+    await embedder_client.client.close()
+
 
 app = FastAPI(
     title="R&V Search",
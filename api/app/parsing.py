@@ -0,0 +1,206 @@
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+
+import app.config as config
+from app.cache import content_hash
+
+
+# Schedule flags, matched as substrings of the lower-cased schedule texts
+SCHEDULES = {
+    "full_day": "полный день",
+    "shift": "сменный",
+    "flexible": "гибкий",
+    "remote": "удален",
+    "rotation": "вахт",
+}
+SCHEDULE_BITS = {name: 1 << i for i, name in enumerate(SCHEDULES)}
+Schedule = Literal["full_day", "shift", "flexible", "remote", "rotation"]
+
+# Minimal required experience (years) of the vacancy experience categories
+VACANCY_EXPERIENCE = {
+    "нет опыта": 0,
+    "от 1 года до 3 лет": 1,
+    "от 3 до 6 лет": 3,
+    "более 6 лет": 6,
+}
+
+# Typed columns derived from the text columns of resumes and vacancies
+TYPED_COLUMNS = {
+    "res": [
+        "salary_min",
+        "salary_max",
+        "exp_years",
+        "city_norm",
+        "schedule_bits",
+        "upd_at",
+        "content_hash",
+    ],
+    "vac": [
+        "salary_min",
+        "salary_max",
+        "exp_years",
+        "city_norm",
+        "schedule_bits",
+        "publ_at",
+        "content_hash",
+    ],
+}
+
+RESUME_EXPERIENCE = (
+    r"опыт работы\s+(?:(?P<years>\d+)\s+(?:год|лет)\w*)?"
+    r"\s*(?:(?P<months>\d+)\s+месяц\w*)?"
+)
+
+
+def _lower(s: pd.Series) -> pd.Series:
+    return s.fillna("").astype(str).str.lower().str.replace("ё", "е")
+
+
+def normalize_city(s: pd.Series) -> pd.Series:
+    """
+    Normalize city texts: the first comma-separated part
+    (resumes also list relocation and business trips readiness),
+    stripped and lower-cased. Unknown cities become "".
+
+    :param s: Series of city texts.
+    """
+    return _lower(s).str.split(",").str[0].str.strip()
+
+
+def parse_schedule(s: pd.Series) -> np.ndarray:
+    """
+    Parse schedule texts into bitmasks of `SCHEDULE_BITS`.
+
+    :param s: Series of schedule texts.
+    """
+    s = _lower(s)
+
+    bits = np.zeros(len(s), dtype="uint8")
+    for name, pattern in SCHEDULES.items():
+        bits[s.str.contains(pattern, regex=False).to_numpy()] |= SCHEDULE_BITS[name]
+
+    return bits
+
+
+def parse_salary(s: pd.Series) -> np.ndarray:
+    """
+    Parse salary texts ("50 000 руб.", "73950.0") into numbers,
+    NaN where there is none. The currency is ignored.
+
+    :param s: Series of salary texts.
+    """
+    s = _lower(s).str.replace(r"\s", "", regex=True).str.replace(",", ".")
+    number = s.str.extract(r"(\d+(?:\.\d+)?)", expand=False)
+
+    return pd.to_numeric(number, errors="coerce").to_numpy(dtype="float32")
+
+
+def parse_resume_experience(s: pd.Series) -> np.ndarray:
+    """
+    Parse resume experience texts ("Опыт работы 5 лет 3 месяца ...")
+    into years, NaN where the experience is not stated.
+
+    :param s: Series of experience texts.
+    """
+    parts = _lower(s).str.extract(RESUME_EXPERIENCE)
+    years = pd.to_numeric(parts["years"], errors="coerce")
+    months = pd.to_numeric(parts["months"], errors="coerce")
+
+    total = years.fillna(0) + months.fillna(0) / 12
+    total[years.isna() & months.isna()] = np.nan
+
+    return total.to_numpy(dtype="float32")
+
+
+def parse_vacancy_experience(s: pd.Series) -> np.ndarray:
+    """
+    Parse vacancy experience categories ("От 1 года до 3 лет")
+    into the minimal required years, NaN for unknown categories.
+
+    :param s: Series of experience categories.
+    """
+    years = _lower(s).str.strip().map(VACANCY_EXPERIENCE)
+
+    return pd.to_numeric(years, errors="coerce").to_numpy(dtype="float32")
+
+
+def parse_date(s: pd.Series) -> pd.Series:
+    """
+    Parse date texts ("16.04.2019 15:59", "2021-05-24T12:00:41+0300")
+    into UTC timestamps, NaT where there is no date.
+
+    :param s: Series of date texts.
+    """
+    return pd.to_datetime(
+        s.fillna("").astype(str).str.strip(),
+        errors="coerce",
+        dayfirst=True,
+        utc=True,
+        format="mixed",
+    )
+
+
+def document_texts(type: str, df: pd.DataFrame) -> list[str]:
+    """
+    Format the embedded texts of resumes or vacancies
+    (`config.res_faiss_func`, `config.vac_faiss_func`).
+
+    :param type: "res" or "vac".
+    :param df: DataFrame with the text columns of the table.
+    """
+    faiss_func = config.res_faiss_func if type == "res" else config.vac_faiss_func
+
+    return [faiss_func(row) for row in df.to_dict("records")]
+
+
+def typed_columns(
+    type: str, df: pd.DataFrame, texts: list[str] | None = None
+) -> pd.DataFrame:
+    """
+    Derive the typed columns of resumes or vacancies
+    (see `TYPED_COLUMNS`) from their text columns.
+
+    :param type: "res" or "vac".
+    :param df: DataFrame with the text columns of the table.
+    :param texts: The embedded texts of the rows, if already formatted
+        (see `document_texts`).
+    """
+    df = df.reset_index(drop=True)
+
+    if type == "res":
+        salary = parse_salary(df["salary"])
+        typed = {
+            "salary_min": salary,
+            "salary_max": salary,
+            "exp_years": parse_resume_experience(df["experience"]),
+            "city_norm": normalize_city(df["city"]),
+            "schedule_bits": parse_schedule(df["schedule"]),
+            "upd_at": parse_date(df["upd_date"]),
+        }
+    else:
+        typed = {
+            "salary_min": parse_salary(df["sal_from"]),
+            "salary_max": parse_salary(df["sal_to"]),
+            "exp_years": parse_vacancy_experience(df["req_exp"]),
+            "city_norm": normalize_city(df["area"]),
+            "schedule_bits": parse_schedule(df["sch_type"]),
+            "publ_at": parse_date(df["publ_date"]),
+        }
+
+    # The hash of the embedded text, duplicates share it (see `dedup_attach`)
+    if texts is None:
+        texts = document_texts(type, df)
+    typed["content_hash"] = [content_hash(text) for text in texts]
+
+    return pd.DataFrame(typed, columns=TYPED_COLUMNS[type])
+
+
+def typed_records(typed: pd.DataFrame) -> list[dict]:
+    """
+    Convert typed columns into database rows, missing values become None.
+
+    :param typed: DataFrame returned by `typed_columns`.
+    """
+    return typed.astype(object).where(typed.notna(), None).to_dict("records")
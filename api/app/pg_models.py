@@ -1,5 +1,7 @@
+from datetime import datetime
+
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Text
+from sqlalchemy import DateTime, Float, Integer, Sequence, SmallInteger, Text
 from sqlalchemy.dialects.postgresql import BIGINT
 
 from app.database import Base
@@ -22,6 +24,23 @@ class Resumes(Base):
     upd_date: Mapped[str] = mapped_column(Text, nullable=True)
     auto: Mapped[str] = mapped_column(Text, nullable=True)
 
+    # Typed columns derived from the text ones (see app.parsing)
+    salary_min: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    salary_max: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    exp_years: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    city_norm: Mapped[str] = mapped_column(Text, nullable=True, index=True)
+    schedule_bits: Mapped[int] = mapped_column(SmallInteger, nullable=True)
+    upd_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=True, index=True
+    )
+    content_hash: Mapped[str] = mapped_column(Text, nullable=True, index=True)
+
+    # Number of later duplicates attached to this row (see config.dedup_attach)
+    dup_count: Mapped[int] = mapped_column(Integer, nullable=True)
+    # Faiss id of the row a duplicate is attached to, NULL for the rows
+    # with their own vector, which faiss id is their primary key
+    vec_id: Mapped[int] = mapped_column(BIGINT, nullable=True, index=True)
+
 
 class Vacancies(Base):
     __tablename__ = "vacancies"
@@ -40,3 +59,30 @@ class Vacancies(Base):
     spec: Mapped[str] = mapped_column(Text, nullable=True)
     tags: Mapped[str] = mapped_column(Text, nullable=True)
     publ_date: Mapped[str] = mapped_column(Text, nullable=True)
+
+    # Typed columns derived from the text ones (see app.parsing)
+    salary_min: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    salary_max: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    exp_years: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    city_norm: Mapped[str] = mapped_column(Text, nullable=True, index=True)
+    schedule_bits: Mapped[int] = mapped_column(SmallInteger, nullable=True)
+    publ_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=True, index=True
+    )
+    content_hash: Mapped[str] = mapped_column(Text, nullable=True, index=True)
+
+    # Number of later duplicates attached to this row (see config.dedup_attach)
+    dup_count: Mapped[int] = mapped_column(Integer, nullable=True)
+    # Faiss id of the row a duplicate is attached to, NULL for the rows
+    # with their own vector, which faiss id is their primary key
+    vec_id: Mapped[int] = mapped_column(BIGINT, nullable=True, index=True)
+
+
+# Primary keys of the attached duplicates, negative so they never
+# collide with the faiss ids of the rows with their own vector
+resume_dup_ids = Sequence(
+    "resumes_dup_p_id_seq", start=-1, increment=-1, metadata=Base.metadata
+)
+vacancy_dup_ids = Sequence(
+    "vacancies_dup_p_id_seq", start=-1, increment=-1, metadata=Base.metadata
+)
@@ -0,0 +1,114 @@
+import argparse
+import asyncio
+import time
+
+import faiss
+import numpy as np
+
+import app.config as config
+from app.indexes import FaissIndex, MmapFlatIndex
+
+
+PATHS = {"res": config.path_to_res_index, "vac": config.path_to_vac_index}
+
+
+def index_vectors(f_index: FaissIndex, start: int) -> np.ndarray:
+    """
+    Read the raw vectors of ids from `start` on back from a flat index,
+    for stores created after the index already held vectors.
+
+    :param f_index: The Faiss index.
+    :param start: First id to read.
+    """
+    if f_index.transform is not None or not isinstance(
+        f_index.index, (faiss.IndexFlat, MmapFlatIndex)
+    ):
+        raise ValueError(
+            f"{f_index.path}: the vectors of a {f_index.index_type} index "
+            "can not be read back, the documents have to be embedded again"
+        )
+
+    if start >= f_index.ntotal:
+        return np.empty((0, f_index.index.d), dtype="float32")
+
+    parts = []
+    index_ntotal = f_index.index.ntotal
+    if start < index_ntotal:
+        if isinstance(f_index.index, MmapFlatIndex):
+            parts.append(np.asarray(f_index.index.xb[start:]))
+        else:
+            parts.append(f_index.index.reconstruct_n(start, index_ntotal - start))
+
+    if f_index.delta is not None and f_index.delta.ntotal:
+        offset = max(0, start - index_ntotal)
+        parts.append(
+            f_index.delta.reconstruct_n(offset, f_index.delta.ntotal - offset)
+        )
+
+    return np.vstack(parts)
+
+
+async def backfill(f_index: FaissIndex) -> int:
+    """
+    Store the vectors of the index, which are missing in its vector
+    store: the ones added before the store existed, and the gaps left
+    by inserts interrupted between the log and the store append.
+
+    :param f_index: The Faiss index.
+
+    Returns:
+        int: The number of vectors added to the store.
+    """
+    async with f_index.write_lock():
+        ids, _ = f_index.vectors.load()
+        missing = np.setdiff1d(np.arange(f_index.ntotal), ids)
+        if len(missing):
+            start = int(missing[0])
+            vectors = index_vectors(f_index, start)[missing - start]
+            f_index.vectors.append(missing.tolist(), vectors)
+
+    return len(missing)
+
+
+async def reindex(type: str, fill: bool) -> None:
+    """
+    Rebuild the index of a document type from its stored vectors
+    as the configured index type, and report the time it took.
+
+    :param type: "res" or "vac".
+    :param fill: Whether to first store the vectors missing in the store.
+    """
+    f_index = FaissIndex(PATHS[type])
+
+    if fill:
+        added = await backfill(f_index)
+        print(f"{type}: {added} vectors copied from the index to the store")
+
+    start = time.perf_counter()
+    vectors = f_index.vectors.dense()
+    await f_index.rebuild(vectors)
+
+    stats = f_index.stats()
+    print(
+        f"{type}: {stats['ntotal']} vectors indexed as {stats['index_type']} "
+        f"({stats['storage']}, reduction {stats['reduction']}) "
+        f"in {time.perf_counter() - start:.1f}s, {stats['bytes']} bytes"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rebuild the faiss indexes from the stored document vectors"
+    )
+    parser.add_argument(
+        "types", nargs="*", choices=list(PATHS), help="default: all of them"
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="first copy the vectors of a flat index, which are not stored yet",
+    )
+    args = parser.parse_args()
+
+    for type in args.types or list(PATHS):
+        asyncio.run(reindex(type, args.backfill))
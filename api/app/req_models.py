@@ -4,7 +4,13 @@ from pydantic import (
     model_validator,
 )
 
-from app.config import min_max_lens, min_len, max_len
+from app.config import (
+    min_max_lens,
+    min_len,
+    max_len,
+    search_batch_max_size,
+    search_batch_max_chars,
+)
 
 
 class ResumeAddingRequest(BaseModel):
@@ -214,3 +220,42 @@ class VacancyAddingRequest(BaseModel):
             ), f"'{k}' length must be in bounds ({_min}, {_max})"
 
         return values
+
+
+class SearchBatchRequest(BaseModel):
+    """
+    Represents a request to search for the matches of many texts at once.
+
+    Fields:
+    - texts: The query texts, the results are returned
+    in the same order. Required field.
+    """
+
+    texts: list[str] = Field(
+        min_length=1,
+        max_length=search_batch_max_size,
+        title="Query texts",
+    )
+
+    @model_validator(mode="before")
+    @classmethod
+    def check_payload_size(cls, values):
+        """
+        Validates the total length of the query texts.
+
+        Args:
+        - values: A dictionary containing the field names and their values.
+
+        Raises:
+        - AssertionError: If the texts are longer
+        than the configured limit in total.
+
+        Returns:
+        - The input values dictionary.
+        """
+        total = sum(len(t) for t in values.get("texts") or [] if isinstance(t, str))
+        assert (
+            total <= search_batch_max_chars
+        ), f"'texts' total length must not exceed {search_batch_max_chars}"
+
+        return values
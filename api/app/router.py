@@ -1,8 +1,25 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import JSONResponse
 
-from app.dao import search_by_embedding, get_text_embedding, update as data_upd
-from app.req_models import ResumeAddingRequest, VacancyAddingRequest
+from app.attributes import SearchFilters
+from app.dao import (
+    attribute_stores,
+    document_cache,
+    search_by_text,
+    search_by_texts,
+    query_cache,
+    result_cache,
+    search_batchers,
+    writer,
+    update as data_upd,
+)
+from app.faiss_pool import search_pool, write_pool
+from app.parsing import Schedule
+from app.req_models import (
+    ResumeAddingRequest,
+    SearchBatchRequest,
+    VacancyAddingRequest,
+)
 
 
 router = APIRouter(tags=["rv_api"])
@@ -12,6 +29,12 @@ router = APIRouter(tags=["rv_api"])
 async def search_vac_by_resume(
     request: Request,
     text: str,
+    city: str | None = None,
+    schedule: Schedule | None = None,
+    salary: float | None = None,
+    experience: float | None = None,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
 ):
     """
     Search for nearest neighbors in
@@ -20,19 +43,27 @@ async def search_vac_by_resume(
     Args:
         request (Request): The FastAPI request object.
         text (str): The resume text for which to search for nearest neighbors.
+        city (str, optional): Only vacancies in this city.
+        schedule (Schedule, optional): Only vacancies with this schedule.
+        salary (float, optional): Only vacancies paying at least this salary.
+        experience (float, optional): Only vacancies requiring
+        at most this experience, in years.
+        nprobe (int, optional): Number of IVF lists to scan (IVF indexes only).
+        ef_search (int, optional): HNSW search queue size (HNSW indexes only).
 
     Returns:
         JSONResponse: The search results as a JSON response,
         including the metadata information retrieved
         from the "vac" table and the "success" key with the value True.
     """
-    q_emb = await get_text_embedding(text)
-
-    result = await search_by_embedding(
-        embedding=q_emb,
+    result = await search_by_text(
+        text=text,
         type="vac",
         session=request.state.db,
         f_indexes=request.state.fd,
+        filters=SearchFilters(city, schedule, salary, experience),
+        nprobe=nprobe,
+        ef_search=ef_search,
     )
 
     return JSONResponse(content=result | {"success": True})
@@ -42,6 +73,12 @@ async def search_vac_by_resume(
 async def search_res_by_vacancy(
     request: Request,
     text: str,
+    city: str | None = None,
+    schedule: Schedule | None = None,
+    salary: float | None = None,
+    experience: float | None = None,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
 ):
     """
     Search for nearest neighbors in
@@ -50,24 +87,102 @@ async def search_res_by_vacancy(
     Args:
         request (Request): The FastAPI request object.
         text (str): The vacancy text for which to search for nearest neighbors.
+        city (str, optional): Only workers living in this city.
+        schedule (Schedule, optional): Only workers wanting this schedule.
+        salary (float, optional): Only workers asking at most this salary.
+        experience (float, optional): Only workers having
+        at least this experience, in years.
+        nprobe (int, optional): Number of IVF lists to scan (IVF indexes only).
+        ef_search (int, optional): HNSW search queue size (HNSW indexes only).
 
     Returns:
         JSONResponse: The search results as a JSON response,
         including the metadata information retrieved
         from the "res" table and the "success" key with the value True.
     """
-    q_emb = await get_text_embedding(text)
-
-    result = await search_by_embedding(
-        embedding=q_emb,
+    result = await search_by_text(
+        text=text,
         type="res",
         session=request.state.db,
         f_indexes=request.state.fd,
+        filters=SearchFilters(city, schedule, salary, experience),
+        nprobe=nprobe,
+        ef_search=ef_search,
     )
 
     return JSONResponse(content=result | {"success": True})
 
 
+@router.post("/search_vac_batch")
+async def search_vac_by_resumes(
+    request: Request,
+    search_info: SearchBatchRequest,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+):
+    """
+    Search for nearest neighbors in
+    the "vac" table for many texts at once.
+
+    Args:
+        request (Request): The FastAPI request object.
+        search_info (SearchBatchRequest): The resume texts
+        for which to search for nearest neighbors.
+        nprobe (int, optional): Number of IVF lists to scan (IVF indexes only).
+        ef_search (int, optional): HNSW search queue size (HNSW indexes only).
+
+    Returns:
+        JSONResponse: The search results as a JSON response:
+        the "results" key with one result per text, in order,
+        and the "success" key with the value True.
+    """
+    results = await search_by_texts(
+        texts=search_info.texts,
+        type="vac",
+        session=request.state.db,
+        f_indexes=request.state.fd,
+        nprobe=nprobe,
+        ef_search=ef_search,
+    )
+
+    return JSONResponse(content={"results": results, "success": True})
+
+
+@router.post("/search_res_batch")
+async def search_res_by_vacancies(
+    request: Request,
+    search_info: SearchBatchRequest,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+):
+    """
+    Search for nearest neighbors in
+    the "resume" table for many texts at once.
+
+    Args:
+        request (Request): The FastAPI request object.
+        search_info (SearchBatchRequest): The vacancy texts
+        for which to search for nearest neighbors.
+        nprobe (int, optional): Number of IVF lists to scan (IVF indexes only).
+        ef_search (int, optional): HNSW search queue size (HNSW indexes only).
+
+    Returns:
+        JSONResponse: The search results as a JSON response:
+        the "results" key with one result per text, in order,
+        and the "success" key with the value True.
+    """
+    results = await search_by_texts(
+        texts=search_info.texts,
+        type="res",
+        session=request.state.db,
+        f_indexes=request.state.fd,
+        nprobe=nprobe,
+        ef_search=ef_search,
+    )
+
+    return JSONResponse(content={"results": results, "success": True})
+
+
 @router.post("/update_res")
 async def update(
     request: Request,
@@ -89,7 +204,6 @@ async def update(
     await data_upd(
         data_to_add=resume_info.model_dump(),
         type="res",
-        session=request.state.db,
         f_indexes=request.state.fd,
     )
 
@@ -117,8 +231,61 @@ async def update(
     await data_upd(
         data_to_add=vacancy_info.model_dump(),
         type="vac",
-        session=request.state.db,
         f_indexes=request.state.fd,
     )
 
     return JSONResponse(content={"success": True})
+
+
+@router.get("/stats")
+async def stats(request: Request):
+    """
+    Report the service caches, writer, faiss thread pools
+    and search coalescing statistics.
+
+    Args:
+        request (Request): The FastAPI request object.
+
+    Returns:
+        JSONResponse: A JSON response with the cache, writer, pool and
+        coalescing statistics and the "success" key with the value True.
+    """
+    return JSONResponse(
+        content={
+            "query_embedding_cache": query_cache.stats(),
+            "result_cache": result_cache.stats(),
+            "document_embedding_cache": (
+                document_cache.stats() if document_cache is not None else None
+            ),
+            "writer": writer.stats(),
+            "faiss_search_pool": search_pool.stats(),
+            "faiss_write_pool": write_pool.stats(),
+            "search_coalescing": {
+                type: search_batchers[f_index].stats()
+                for type, f_index in request.state.fd.items()
+                if f_index in search_batchers
+            },
+            "success": True,
+        }
+    )
+
+
+@router.get("/indexes")
+async def indexes(request: Request):
+    """
+    Report type and memory footprint of the Faiss indexes
+    and of their attribute stores.
+
+    Args:
+        request (Request): The FastAPI request object.
+
+    Returns:
+        JSONResponse: A JSON response with the statistics of
+        every index and the "success" key with the value True.
+    """
+    result = {
+        type: f_index.stats() | {"attributes": attribute_stores[type].stats()}
+        for type, f_index in request.state.fd.items()
+    }
+
+    return JSONResponse(content=result | {"success": True})
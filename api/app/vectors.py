@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+
+import app.config as config
+
+
+class VectorStore:
+    """
+    Append-only store of the raw (untransformed) document embeddings,
+    keyed by faiss id: a file of float32 rows with an int64 id sidecar.
+    It outlives any index type change, so indexes can be rebuilt from
+    it without calling the embedder again.
+
+    The vectors are written before their ids, so the id file is the
+    commit marker: a row counts only once its id is written, and a
+    torn append is cut off by the next one. Appends must be serialized
+    by the caller (`FaissIndex` appends under its write lock).
+    """
+
+    def __init__(self, path: str, dim: int) -> None:
+        """
+        :param path: Path of the vectors file, the ids go to `{path}.ids`.
+        :param dim: Vectors dimension.
+        """
+        self.path = path
+        self.ids_path = f"{path}.ids"
+        self.dim = dim
+        self.row_size = dim * 4
+
+    def __len__(self) -> int:
+        """Number of complete rows."""
+        return min(
+            _file_size(self.ids_path) // 8, _file_size(self.path) // self.row_size
+        )
+
+    def append(self, ids: list[int], vectors: np.ndarray) -> None:
+        """
+        Durably append vectors.
+
+        :param ids: Faiss ids of the vectors.
+        :param vectors: float32 array of shape (len(ids), dim).
+        """
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        if vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}"
+            )
+
+        # Drop the leftovers of a torn append
+        n = len(self)
+        for path, size in ((self.path, n * self.row_size), (self.ids_path, n * 8)):
+            if _file_size(path) > size:
+                os.truncate(path, size)
+
+        for path, data in (
+            (self.path, vectors.tobytes()),
+            (self.ids_path, np.asarray(ids, dtype="<i8").tobytes()),
+        ):
+            with open(path, "ab") as f:
+                f.write(data)
+                f.flush()
+                if config.wal_fsync:
+                    os.fsync(f.fileno())
+
+    def load(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Map the stored rows read-only, in append order.
+
+        Returns:
+            tuple: The ids and the (memory-mapped) vectors.
+        """
+        n = len(self)
+        if n == 0:
+            return (
+                np.empty(0, dtype="int64"),
+                np.empty((0, self.dim), dtype="float32"),
+            )
+
+        ids = np.fromfile(self.ids_path, dtype="<i8", count=n)
+        vectors = np.memmap(self.path, dtype="<f4", mode="r", shape=(n, self.dim))
+
+        return ids, vectors
+
+    def dense(self) -> np.ndarray:
+        """
+        The vectors ordered by id, row i holding the vector of id i.
+        When ids were appended in order (the usual case) the vectors
+        stay memory-mapped, otherwise they are copied. Of vectors stored
+        more than once the last one wins.
+        """
+        ids, vectors = self.load()
+        if np.array_equal(ids, np.arange(len(ids))):
+            return vectors
+
+        # Positions of the last occurrence of every id
+        unique, last = np.unique(ids[::-1], return_index=True)
+        if len(unique) and (unique[0] < 0 or unique[-1] != len(unique) - 1):
+            missing = int(unique[-1]) + 1 - len(unique)
+            raise ValueError(
+                f"{self.path}: vectors of {missing} ids are missing, "
+                "store them with `app.reindex --backfill`"
+            )
+
+        return np.asarray(vectors[len(ids) - 1 - last])
+
+    def stats(self) -> dict:
+        """Report the number of stored vectors and their size."""
+        return {
+            "vectors": len(self),
+            "bytes": _file_size(self.path) + _file_size(self.ids_path),
+        }
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
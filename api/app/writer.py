@@ -0,0 +1,139 @@
+import asyncio
+import contextlib
+
+
+class GroupWriter:
+    """
+    Single worker task fed by a queue. Concurrent requests (writes,
+    or searches) are collected for a short time window and applied
+    as one group, every caller awaits the result of its own item.
+    Up to `concurrency` groups are applied at once (writes keep
+    the default of one, so they are applied in order).
+    """
+
+    def __init__(
+        self,
+        write_fn,
+        max_batch_size: int,
+        max_wait_ms: float,
+        concurrency: int = 1,
+    ) -> None:
+        """
+        :param write_fn: A coroutine function applying a list of items
+            and returning one result per item, in the same order.
+        :param max_batch_size: Maximum number of items in one group.
+        :param max_wait_ms: Maximum time (in ms) the first item
+            of a group waits for other items to join it.
+        :param concurrency: Maximum number of groups applied at once.
+        """
+        self.write_fn = write_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.concurrency = concurrency
+
+        self.queue = None
+        self.slots = None
+        self.worker = None
+        self.tasks = set()
+
+        self.groups = 0
+        self.items = 0
+        self.failed_groups = 0
+        self.max_group_size = 0
+
+    def start(self) -> None:
+        """Start the worker task, if it is not running yet."""
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.slots = asyncio.Semaphore(self.concurrency)
+            self.worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Apply the already queued items and stop the worker task."""
+        if self.worker is None:
+            return
+
+        await self.queue.join()
+        self.worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.worker
+        self.worker = None
+
+    async def submit(self, item):
+        """
+        Enqueue an item and wait until its group is applied.
+
+        :param item: The item passed to `write_fn`.
+        """
+        self.start()
+
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, fut))
+
+        return await fut
+
+    def stats(self) -> dict:
+        """Return queue depth and group size counters."""
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "in_flight": len(self.tasks),
+            "groups": self.groups,
+            "items": self.items,
+            "failed_groups": self.failed_groups,
+            "mean_group_size": self.items / self.groups if self.groups else 0.0,
+            "max_group_size": self.max_group_size,
+        }
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already waiting before sleeping
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # The next group is collected while a slot is free only,
+            # so it keeps growing while all slots are busy
+            await self.slots.acquire()
+            batch = await self._collect()
+
+            task = asyncio.create_task(self._apply(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _apply(self, batch: list) -> None:
+        try:
+            results = await self.write_fn([item for item, _ in batch])
+        except Exception as e:
+            self.failed_groups += 1
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            self.groups += 1
+            self.items += len(batch)
+            self.max_group_size = max(self.max_group_size, len(batch))
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+        finally:
+            self.slots.release()
+            for _ in batch:
+                self.queue.task_done()
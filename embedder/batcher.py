@@ -0,0 +1,118 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MicroBatcher:
+    """
+    This class collects concurrent single-text requests for a short
+    time window and encodes them as one batch.
+    """
+
+    def __init__(self, encode_fn, max_batch_size, max_wait_ms, concurrency=1):
+        """
+        Initializes the MicroBatcher.
+
+        Args:
+        - encode_fn: A function mapping a list of texts
+        to a 2D array of embeddings.
+        - max_batch_size: The maximum number of texts in one batch.
+        - max_wait_ms: The maximum time (in ms) the first request
+        of a batch waits for other requests to join it.
+        - concurrency: The maximum number of batches encoded at once.
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        # At most one batch per model instance, further batches are queued
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.slots = None
+        self.queue = None
+        self.worker = None
+        self.tasks = set()
+
+    async def submit(self, text):
+        """
+        Enqueues a single text and waits for its embedding.
+
+        Args:
+        - text: The input text.
+
+        Returns:
+        - emb: The embedding of the text.
+        """
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.slots = asyncio.Semaphore(self.concurrency)
+            self.worker = asyncio.create_task(self._run())
+
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, fut))
+
+        return await fut
+
+    async def encode_many(self, texts):
+        """
+        Encodes an already batched list of texts,
+        bypassing the collection window.
+
+        Args:
+        - texts: The list of input texts.
+
+        Returns:
+        - embs: A 2D array of embeddings.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.encode_fn, texts)
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already waiting before sleeping
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            # The next batch is collected while a slot is free only,
+            # so it keeps growing while all model instances are busy
+            await self.slots.acquire()
+            batch = await self._collect()
+
+            task = asyncio.create_task(self._encode_batch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _encode_batch(self, batch):
+        texts = [text for text, _ in batch]
+
+        try:
+            embs = await self.encode_many(texts)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self.slots.release()
+
+        for (_, fut), emb in zip(batch, embs):
+            if not fut.done():
+                fut.set_result(emb)
@@ -1 +1,43 @@
 WEIGHTS_PATH="weights/ce_model"
+
+# Inference backend: torch, onnx or onnx_int8 (dynamic int8 quantization)
+BACKEND = "torch"
+ONNX_DIR = "weights/ce_model_onnx"
+ONNX_THREADS = 0  # 0 lets ONNX Runtime decide
+# ONNX embeddings less similar (cosine) to the torch ones need a re-index
+PARITY_MIN_COSINE = 0.99
+PARITY_TEXTS = [
+    "Ищу специалиста по ML",
+    "Имею опыт работы по машинному обучению, работал на PyTorch и Tensorflow",
+    "Требуется пекарь в местную булочную",
+    "Ищет работу на должность: менеджер проектов; Опыт работы 5 лет 3 месяца",
+    "Системный администратор, полный день. Требуемый опыт: От 1 года до 3 лет",
+    "Frontend developer, React, TypeScript, remote",
+]
+
+# Dynamic micro-batching of concurrent /search requests
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 5
+# Texts per /embed_batch request, the API sends up to
+# max(seed_batch_size, search_batch_max_size) of them at once
+MAX_REQUEST_TEXTS = 256
+
+# Warmup batches run after loading, texts of every length (in words)
+# are encoded in batches of every size
+WARMUP_TEXT_LENGTHS = [8, 64, 256]
+WARMUP_BATCH_SIZES = [1, MAX_BATCH_SIZE]
+WARMUP_TEXT = (
+    "Ищет работу на должность: менеджер проектов; Опыт работы 5 лет 3 месяца; "
+    "Python, SQL, машинное обучение, ведение переговоров и презентаций"
+)
+
+# Multi-process inference, 0 workers serves the model in-process.
+# Every worker gets THREADS_PER_WORKER inference threads (0 splits
+# the cores evenly) and, with PIN_WORKERS, its own cores
+INFERENCE_WORKERS = 0
+THREADS_PER_WORKER = 0
+PIN_WORKERS = True
+
+# Binary wire format for embeddings (negotiated via the Accept header)
+BINARY_MEDIA_TYPE = "application/octet-stream"
+WIRE_DTYPES = {"float32": "<f4", "float16": "<f2"}
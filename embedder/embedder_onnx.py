@@ -0,0 +1,317 @@
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+from config import (
+    WEIGHTS_PATH,
+    MAX_BATCH_SIZE,
+    ONNX_DIR,
+    ONNX_THREADS,
+    PARITY_TEXTS,
+    PARITY_MIN_COSINE,
+    WARMUP_BATCH_SIZES,
+    WARMUP_TEXT_LENGTHS,
+    WARMUP_TEXT,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def onnx_model_path(quantize):
+    """
+    Returns the path of the exported model.
+
+    Args:
+    - quantize: Whether the int8-quantized model is meant.
+    """
+    name = "model_int8.onnx" if quantize else "model.onnx"
+    return os.path.join(ONNX_DIR, name)
+
+
+def parity_check(reference_fn, encode_fn, texts=PARITY_TEXTS):
+    """
+    Compares the embeddings of a backend with the reference
+    (torch) embeddings of the same texts.
+
+    Args:
+    - reference_fn: A function mapping a list of texts
+    to the reference embeddings.
+    - encode_fn: A function mapping a list of texts
+    to the embeddings of the checked backend.
+    - texts: The texts to compare the embeddings of.
+
+    Returns:
+    - report: A dictionary with the cosine similarity statistics
+    and the "reindex_required" flag, which is set when the embeddings
+    deviate too much to be searched in indexes built by the reference.
+    """
+    expected = np.asarray(reference_fn(texts), dtype="float32")
+    found = np.asarray(encode_fn(texts), dtype="float32")
+
+    cosine = np.sum(expected * found, axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(found, axis=1)
+    )
+
+    return {
+        "texts": len(texts),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "max_abs_diff": float(np.abs(expected - found).max()),
+        "min_cosine_required": PARITY_MIN_COSINE,
+        "reindex_required": bool(cosine.min() < PARITY_MIN_COSINE),
+    }
+
+
+def export_onnx(quantize=False):
+    """
+    Exports the sentence transformer model (transformer, pooling and
+    the following layers) to ONNX once, optionally quantizes its weights
+    to int8, and stores the parity report next to every exported model.
+
+    The models are written under temporary names and renamed once
+    complete, so an interrupted export is never served.
+
+    Torch and sentence-transformers are only needed here.
+
+    Args:
+    - quantize: Whether to also write the int8-quantized model.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(WEIGHTS_PATH, device="cpu")
+    model.eval()
+
+    os.makedirs(ONNX_DIR, exist_ok=True)
+    model.tokenizer.save_pretrained(ONNX_DIR)
+
+    sample = model.tokenizer(["Ищу специалиста по ML"], return_tensors="pt")
+    input_names = list(sample.keys())
+
+    class SentenceEmbedding(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            features = dict(zip(input_names, inputs))
+            return self.model(features)["sentence_embedding"]
+
+    axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    with torch.no_grad():
+        torch.onnx.export(
+            SentenceEmbedding(),
+            tuple(sample[name] for name in input_names),
+            f"{onnx_model_path(False)}.tmp",
+            input_names=input_names,
+            output_names=["sentence_embedding"],
+            dynamic_axes=axes | {"sentence_embedding": {0: "batch"}},
+            opset_version=14,
+            do_constant_folding=True,
+        )
+
+    with open(os.path.join(ONNX_DIR, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "max_seq_length": model.get_max_seq_length(),
+                "dim": model.get_sentence_embedding_dimension(),
+            },
+            f,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            f"{onnx_model_path(False)}.tmp",
+            f"{onnx_model_path(True)}.tmp",
+            weight_type=QuantType.QInt8,
+        )
+
+    for q in sorted({False, quantize}):
+        os.replace(f"{onnx_model_path(q)}.tmp", onnx_model_path(q))
+
+    def reference_fn(texts):
+        with torch.no_grad():
+            return model.encode(texts, convert_to_numpy=True)
+
+    for q in sorted({False, quantize}):
+        report = parity_check(reference_fn, OnnxEmbedder(quantize=q).encode)
+        with open(f"{onnx_model_path(q)}.parity.json", "w") as f:
+            json.dump(report, f)
+
+
+def prepare_backend(backend):
+    """
+    Exports the model of an ONNX backend if it was not exported yet.
+    Called by the parent process before starting a pool of workers,
+    so they never export the model concurrently.
+
+    Args:
+    - backend: "torch", "onnx" or "onnx_int8".
+    """
+    if backend in ("onnx", "onnx_int8"):
+        quantize = backend == "onnx_int8"
+        if not os.path.exists(onnx_model_path(quantize)):
+            export_onnx(quantize)
+
+
+class OnnxEmbedder:
+    """
+    This class is responsible for creating embeddings of input
+    sentences with the ONNX export of the sentence transformer model,
+    served by ONNX Runtime on CPU.
+    """
+
+    def __init__(self, quantize=False, threads=ONNX_THREADS):
+        """
+        Initializes the OnnxEmbedder class, exporting the model first
+        if it was not exported yet.
+
+        Args:
+        - quantize: Whether to serve the int8-quantized model.
+        - threads: The number of intra-op threads, 0 lets
+        ONNX Runtime decide.
+        """
+        self.path = onnx_model_path(quantize)
+        if not os.path.exists(self.path):
+            export_onnx(quantize)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(ONNX_DIR)
+
+        with open(os.path.join(ONNX_DIR, "meta.json")) as f:
+            meta = json.load(f)
+        self.max_seq_length = meta["max_seq_length"]
+        self.dim = meta["dim"]
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = ort.InferenceSession(
+            self.path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.parity = None
+        if os.path.exists(f"{self.path}.parity.json"):
+            with open(f"{self.path}.parity.json") as f:
+                self.parity = json.load(f)
+
+        if self.parity is not None and self.parity["reindex_required"]:
+            logger.warning(
+                f"{self.path} embeddings deviate from the torch model "
+                f"(min cosine {self.parity['min_cosine']:.4f}), "
+                "the indexes have to be rebuilt with this backend"
+            )
+
+    def answer(self, query):
+        """
+        Generates the embedding of the input query.
+
+        Args:
+        - query: The input query for which the
+        embedding needs to be generated.
+
+        Returns:
+        - result: A dictionary containing the query
+        embedding as a list of floating-point numbers.
+        """
+        result = {
+            "query_embedding": self.encode([query])[0].tolist(),
+        }
+
+        return result
+
+    def encode(self, queries, batch_size=MAX_BATCH_SIZE):
+        """
+        Generates embeddings for a list of queries. Queries are
+        sorted by length, so batches are padded as little as possible.
+
+        Args:
+        - queries: The list of input queries.
+        - batch_size: The number of queries encoded at once.
+
+        Returns:
+        - embs: A float32 numpy array of shape (len(queries), dim).
+        """
+        embs = np.empty((len(queries), self.dim), dtype="float32")
+
+        order = np.argsort([-len(q) for q in queries], kind="stable")
+        for start in range(0, len(queries), batch_size):
+            idx = order[start : start + batch_size]
+
+            tokens = self.tokenizer(
+                [queries[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            inputs = {
+                name: values.astype("int64")
+                for name, values in tokens.items()
+                if name in self.input_names
+            }
+
+            embs[idx] = self.session.run(None, inputs)[0]
+
+        return embs
+
+
+def create_embedder(backend, threads=0):
+    """
+    Creates the embedder of the configured backend.
+
+    Args:
+    - backend: "torch", "onnx" or "onnx_int8".
+    - threads: The number of inference threads, 0 keeps the default.
+
+    Returns:
+    - embedder: An object with the `answer` and `encode` methods.
+    """
+    if backend == "torch":
+        from embedder_sbert import Embedder
+
+        return Embedder(threads=threads)
+
+    if backend in ("onnx", "onnx_int8"):
+        return OnnxEmbedder(
+            quantize=backend == "onnx_int8", threads=threads or ONNX_THREADS
+        )
+
+    raise ValueError(f"Unknown embedder backend '{backend}'")
+
+
+def warmup_embedder(embedder):
+    """
+    Encodes batches of representative shapes once, so lazy kernel
+    and tokenizer initialization is not paid by real requests.
+
+    Args:
+    - embedder: The embedder to warm up.
+    """
+    words = WARMUP_TEXT.split()
+    for length in WARMUP_TEXT_LENGTHS:
+        text = " ".join(words[i % len(words)] for i in range(length))
+        for batch_size in WARMUP_BATCH_SIZES:
+            embedder.encode([text] * batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the model to ONNX and check its parity"
+    )
+    parser.add_argument("--int8", action="store_true", help="also quantize to int8")
+    args = parser.parse_args()
+
+    export_onnx(quantize=args.int8)
+
+    for q in sorted({False, args.int8}):
+        print(onnx_model_path(q), OnnxEmbedder(quantize=q).parity)
@@ -1,7 +1,8 @@
+import numpy as np
 import torch
 from sentence_transformers import SentenceTransformer
 
-from config import WEIGHTS_PATH
+from config import WEIGHTS_PATH, MAX_BATCH_SIZE
 
 
 class Embedder:
@@ -10,11 +11,17 @@ class Embedder:
     input sentences using a pre-trained sentence transformer model.
     """
 
-    def __init__(self):
+    def __init__(self, threads=0):
         """
         Initializes the Embedder class by creating an
         instance of the SentenceTransformer model and setting the device.
+
+        Args:
+        - threads: The number of torch intra-op threads, 0 keeps the default.
         """
+        if threads:
+            torch.set_num_threads(threads)
+
         self.model = SentenceTransformer(WEIGHTS_PATH)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model.to(device=self.device)
@@ -32,15 +39,35 @@ class Embedder:
         - result: A dictionary containing the query
         embedding as a list of floating-point numbers.
         """
-        with torch.no_grad():
-            emb = self.model.encode(query, convert_to_tensor=True)
-
         result = {
-            "query_embedding": [float(el) for el in torch.squeeze(emb)],
+            "query_embedding": self.encode([query])[0].tolist(),
         }
 
         return result
 
+    def encode(self, queries, batch_size=MAX_BATCH_SIZE):
+        """
+        Generates embeddings for a list of queries
+        in a single forward pass per batch.
+
+        Args:
+        - queries: The list of input queries.
+        - batch_size: The number of queries encoded at once.
+
+        Returns:
+        - embs: A float32 numpy array of shape (len(queries), dim).
+        """
+        if not queries:
+            dim = self.model.get_sentence_embedding_dimension()
+            return np.empty((0, dim), dtype="float32")
+
+        with torch.no_grad():
+            embs = self.model.encode(
+                queries, batch_size=batch_size, convert_to_numpy=True
+            )
+
+        return embs.astype("float32", copy=False)
+
 
 if __name__ == "__main__":
     emb = Embedder()
@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+
+from fastapi import HTTPException
+from fastapi import status
+
+from batcher import MicroBatcher
+from embedder_onnx import create_embedder, prepare_backend, warmup_embedder
+from pool import InferencePool
+from config import (
+    MAX_BATCH_SIZE,
+    MAX_WAIT_MS,
+    INFERENCE_WORKERS,
+    THREADS_PER_WORKER,
+    PIN_WORKERS,
+)
+
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class ModelLoader:
+    """
+    This class loads the model in a background thread, so the service
+    starts listening immediately, and warms it up before reporting
+    it as ready. With INFERENCE_WORKERS set, the model is served by
+    a pool of worker processes instead.
+    """
+
+    def __init__(self, backend):
+        """
+        Initializes the ModelLoader.
+
+        Args:
+        - backend: The inference backend (see `create_embedder`).
+        """
+        self.backend = backend
+        self.embedder = None
+        self.pool = None
+        self.batcher = MicroBatcher(
+            encode_fn=self._encode,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=MAX_WAIT_MS,
+            concurrency=max(1, INFERENCE_WORKERS),
+        )
+
+        self.status = "starting"
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.thread = None
+
+    @property
+    def ready(self):
+        """Whether the model is loaded and warmed up."""
+        return self.status == "ready"
+
+    def start(self):
+        """Starts loading the model in a background thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._load, daemon=True)
+            self.thread.start()
+
+    def check(self):
+        """
+        Raises a 503 error unless the model is ready.
+        """
+        if not self.ready:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Model is not ready: {self.status}",
+            )
+
+    def state(self):
+        """
+        Returns the model state.
+
+        Returns:
+        - state: A dictionary with the status, the error if
+        loading failed, the load and warmup times, and the
+        per-worker queue depth when served by a pool.
+        """
+        return {
+            "backend": self.backend,
+            "status": self.status,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "pool": self.pool.stats() if self.pool is not None else None,
+        }
+
+    def _encode(self, texts):
+        if self.pool is not None:
+            return self.pool.encode(texts)
+        return self.embedder.encode(texts)
+
+    def _load(self):
+        try:
+            if INFERENCE_WORKERS:
+                self._load_pool()
+            else:
+                self._load_embedder()
+
+            self.status = "ready"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            logger.exception("Model loading failed")
+
+    def _load_embedder(self):
+        self.status = "loading"
+        start = time.perf_counter()
+        self.embedder = create_embedder(self.backend)
+        self.load_seconds = time.perf_counter() - start
+        logger.info(f"Model ({self.backend}) loaded in {self.load_seconds:.2f}s")
+
+        self.status = "warming_up"
+        start = time.perf_counter()
+        warmup_embedder(self.embedder)
+        self.warmup_seconds = time.perf_counter() - start
+        logger.info(f"Model warmed up in {self.warmup_seconds:.2f}s")
+
+    def _load_pool(self):
+        # Workers load and warm up their models in parallel
+        self.status = "loading"
+        prepare_backend(self.backend)
+        pool = InferencePool(
+            self.backend, INFERENCE_WORKERS, THREADS_PER_WORKER, PIN_WORKERS
+        )
+        pool.start()
+
+        self.pool = pool
+        self.load_seconds = pool.load_seconds
+        self.warmup_seconds = pool.warmup_seconds
+        logger.info(
+            f"Model ({self.backend}) loaded in {INFERENCE_WORKERS} workers "
+            f"with {pool.threads} threads each in {self.load_seconds:.2f}s, "
+            f"warmed up in {self.warmup_seconds:.2f}s"
+        )
@@ -1,7 +1,16 @@
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 
-from router import router as root_router
+from router import model, router as root_router
+
+
+@asynccontextmanager
+async def load_model(app: FastAPI):
+    # Not awaited: requests are answered with 503 until the model is ready
+    model.start()
+    yield
 
 
 app = FastAPI(
@@ -10,6 +19,7 @@ app = FastAPI(
     version="0.0.1",
     docs_url="/docs",
     redoc_url=None,
+    lifespan=load_model,
 )
 
 app.include_router(root_router)
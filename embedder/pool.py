@@ -0,0 +1,228 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+def _serve(worker_id, backend, threads, cores, requests, results):
+    """
+    Worker process main loop: loads and warms up its own model,
+    then encodes the batches sent to it until it gets None.
+    """
+    # Pinned and limited before the inference libraries are imported
+    if cores:
+        os.sched_setaffinity(0, cores)
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    from embedder_onnx import create_embedder, warmup_embedder
+
+    try:
+        start = time.perf_counter()
+        embedder = create_embedder(backend, threads=threads)
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        warmup_embedder(embedder)
+        warmup_seconds = time.perf_counter() - start
+    except Exception as e:
+        results.put((worker_id, "failed", None, repr(e)))
+        return
+
+    results.put((worker_id, "ready", (load_seconds, warmup_seconds), None))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+
+        req_id, texts = request
+        try:
+            results.put((worker_id, req_id, embedder.encode(texts), None))
+        except Exception as e:
+            results.put((worker_id, req_id, None, repr(e)))
+
+
+class InferencePool:
+    """
+    This class runs the model in several worker processes, each
+    pinned to its own share of the cores with a matching number of
+    inference threads, so concurrent batches do not compete for the
+    same intra-op threads. Every batch goes to the least-loaded worker.
+    """
+
+    def __init__(self, backend, workers, threads_per_worker, pin):
+        """
+        Initializes the InferencePool.
+
+        Args:
+        - backend: The inference backend (see `create_embedder`).
+        - workers: The number of worker processes.
+        - threads_per_worker: The number of inference threads per
+        worker, 0 splits the available cores evenly.
+        - pin: Whether to pin every worker to its own cores.
+        """
+        cores = sorted(os.sched_getaffinity(0))
+
+        self.backend = backend
+        self.workers = workers
+        self.threads = threads_per_worker or max(1, len(cores) // workers)
+
+        self.cores = [
+            [cores[(i * self.threads + j) % len(cores)] for j in range(self.threads)]
+            if pin
+            else None
+            for i in range(workers)
+        ]
+
+        # Spawned, so workers do not inherit the threads of this process
+        self.ctx = mp.get_context("spawn")
+        self.results = self.ctx.Queue()
+        self.requests = [self.ctx.Queue() for _ in range(workers)]
+        self.processes = []
+
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.pending = {}
+        self.depth = [0] * workers
+        self.processed = [0] * workers
+        self.dead = set()
+        self.reader = None
+
+        self.load_seconds = None
+        self.warmup_seconds = None
+
+    def start(self):
+        """
+        Starts the workers and blocks until all of
+        them have loaded and warmed up their models.
+        """
+        for i in range(self.workers):
+            process = self.ctx.Process(
+                target=_serve,
+                args=(
+                    i,
+                    self.backend,
+                    self.threads,
+                    self.cores[i],
+                    self.requests[i],
+                    self.results,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+
+        timings = []
+        for _ in range(self.workers):
+            worker_id, status, timing, error = self.results.get()
+            if status == "failed":
+                raise RuntimeError(f"Worker {worker_id} failed to load: {error}")
+            timings.append(timing)
+
+        self.load_seconds = max(t[0] for t in timings)
+        self.warmup_seconds = max(t[1] for t in timings)
+
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def encode(self, texts):
+        """
+        Encodes a batch of texts in the least-loaded worker,
+        blocking the calling thread until it is done.
+
+        Args:
+        - texts: The list of input texts.
+
+        Returns:
+        - embs: A float32 numpy array of shape (len(texts), dim).
+        """
+        fut = Future()
+
+        with self.lock:
+            alive = [i for i in range(self.workers) if i not in self.dead]
+            if not alive:
+                raise RuntimeError("No inference worker is alive")
+
+            worker_id = min(alive, key=self.depth.__getitem__)
+            self.depth[worker_id] += 1
+
+            req_id = next(self.ids)
+            self.pending[req_id] = (worker_id, fut)
+
+        self.requests[worker_id].put((req_id, texts))
+
+        return fut.result()
+
+    def stats(self):
+        """
+        Returns the per-worker queue depth and load.
+
+        Returns:
+        - stats: A list with one dictionary per worker.
+        """
+        return [
+            {
+                "worker": i,
+                "pid": process.pid,
+                "alive": process.is_alive(),
+                "cores": self.cores[i],
+                "threads": self.threads,
+                "queue_depth": self.depth[i],
+                "processed": self.processed[i],
+            }
+            for i, process in enumerate(self.processes)
+        ]
+
+    def _read(self):
+        # Checked every second, also while results keep arriving
+        checked_at = time.monotonic()
+        while True:
+            if time.monotonic() - checked_at >= 1:
+                self._fail_dead_workers()
+                checked_at = time.monotonic()
+
+            try:
+                worker_id, req_id, embs, error = self.results.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            with self.lock:
+                # Already failed, if its worker died after sending it
+                if req_id not in self.pending:
+                    continue
+                _, fut = self.pending.pop(req_id)
+                self.depth[worker_id] -= 1
+                self.processed[worker_id] += 1
+
+            if error is None:
+                fut.set_result(embs)
+            else:
+                fut.set_exception(RuntimeError(error))
+
+    def _fail_dead_workers(self):
+        # Batches sent to a crashed worker would otherwise wait forever
+        dead = {i for i, p in enumerate(self.processes) if not p.is_alive()}
+        if dead <= self.dead:
+            return
+
+        with self.lock:
+            # Dead workers are never picked again
+            self.dead |= dead
+
+            failed = [
+                (req_id, fut)
+                for req_id, (worker_id, fut) in self.pending.items()
+                if worker_id in dead
+            ]
+            for req_id, _ in failed:
+                del self.pending[req_id]
+
+            for worker_id in dead:
+                self.depth[worker_id] = 0
+
+        for _, fut in failed:
+            fut.set_exception(RuntimeError("Inference worker died"))
@@ -0,0 +1,32 @@
+from pydantic import BaseModel, Field
+
+from config import MAX_REQUEST_TEXTS
+
+
+class EmbedRequest(BaseModel):
+    """
+    Represents a request to embed a single text.
+
+    Fields:
+    - text: The text to be embedded. Required field.
+    """
+
+    text: str = Field(
+        title="Text to be embedded",
+    )
+
+
+class EmbedBatchRequest(BaseModel):
+    """
+    Represents a request to embed several texts at once.
+
+    Fields:
+    - texts: The list of texts to be embedded, at least one and
+    at most MAX_REQUEST_TEXTS. Required field.
+    """
+
+    texts: list[str] = Field(
+        title="Texts to be embedded",
+        min_length=1,
+        max_length=MAX_REQUEST_TEXTS,
+    )
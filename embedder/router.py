@@ -1,29 +1,169 @@
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi import status
+import numpy as np
 
-from embedder_sbert import Embedder
+from loader import ModelLoader
+from req_models import EmbedRequest, EmbedBatchRequest
+from config import BACKEND, WIRE_DTYPES, BINARY_MEDIA_TYPE
 
 
 router = APIRouter(tags=["embedder"])
-embedder = Embedder()
+# The model is loaded in the background once the app starts
+model = ModelLoader(BACKEND)
+
+
+def embedding_response(request: Request, embs, key):
+    """
+    Build a response with the embeddings in the format
+    negotiated by the client.
+
+    If the client accepts `application/octet-stream`, the embeddings
+    are sent as raw little-endian bytes (dtype is taken from the
+    `X-Embedding-Dtype` request header, float32 by default) with
+    count, dimension and dtype in the response headers. Otherwise
+    a JSON object with the embeddings under `key` is returned.
+
+    Args:
+        request (Request): The incoming request.
+        embs (np.ndarray): The embeddings, 1D for a single text or 2D.
+        key (str): The JSON key for the fallback response.
+
+    Returns:
+        Response: The binary or JSON response.
+    """
+    if BINARY_MEDIA_TYPE not in request.headers.get("accept", ""):
+        return JSONResponse(
+            status_code=status.HTTP_200_OK, content={key: embs.tolist()}
+        )
+
+    dtype = request.headers.get("x-embedding-dtype", "float32")
+    if dtype not in WIRE_DTYPES:
+        dtype = "float32"
+
+    embs = np.atleast_2d(embs).astype(WIRE_DTYPES[dtype], copy=False)
+
+    return Response(
+        status_code=status.HTTP_200_OK,
+        content=embs.tobytes(),
+        media_type=BINARY_MEDIA_TYPE,
+        headers={
+            "X-Embedding-Count": str(embs.shape[0]),
+            "X-Embedding-Dim": str(embs.shape[1]),
+            "X-Embedding-Dtype": dtype,
+        },
+    )
 
 
 @router.get("/search")
-def search(user_text: str):
+async def search(request: Request, user_text: str):
     """
     Process the user's text and
     return a JSON response.
 
+    Concurrent requests are collected by the
+    micro-batcher and encoded as one batch.
+
     Args:
+        request (Request): The incoming request.
         user_text (str): The text provided by
         the user that needs to be processed.
 
     Returns:
-        JSON response: A JSON response object with a status
-        code of 200 and the content is the result of calling
-        the `answer` method of the `Embedder` instance.
+        Response: A response object with a status code of 200
+        and the content is the query embedding (see `embedding_response`).
+    """
+    model.check()
+    emb = await model.batcher.submit(user_text)
+
+    return embedding_response(request, emb, "query_embedding")
+
+
+@router.post("/embed")
+async def embed(request: Request, query: EmbedRequest):
+    """
+    Same as `/search`, but the text is passed in
+    the request body, so long texts are not limited
+    by the query string length.
+
+    Args:
+        request (Request): The incoming request.
+        query (EmbedRequest): The text that needs to be processed.
+
+    Returns:
+        Response: A response object with a status code of 200
+        and the content is the query embedding (see `embedding_response`).
+    """
+    model.check()
+    emb = await model.batcher.submit(query.text)
+
+    return embedding_response(request, emb, "query_embedding")
+
+
+@router.post("/embed_batch")
+async def embed_batch(request: Request, batch: EmbedBatchRequest):
+    """
+    Process a list of texts and
+    return their embeddings in the same order.
+
+    Args:
+        request (Request): The incoming request.
+        batch (EmbedBatchRequest): The texts that need to be processed.
+
+    Returns:
+        Response: A response object with a status code of 200
+        and the content is the embeddings (see `embedding_response`).
+    """
+    model.check()
+    embs = await model.batcher.encode_many(batch.texts)
+
+    return embedding_response(request, embs, "embeddings")
+
+
+@router.get("/info")
+async def info():
+    """
+    Report the inference backend and, for ONNX backends,
+    the parity of its embeddings with the torch model.
+
+    Returns:
+        JSONResponse: A JSON response with the backend name and
+        the parity report (None when it is not available).
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "backend": BACKEND,
+            "parity": getattr(model.embedder, "parity", None),
+        },
+    )
+
+
+@router.get("/live")
+async def live():
+    """
+    Liveness probe: the process is up and serving requests.
+
+    Returns:
+        JSONResponse: A response with a status code of 200.
+    """
+    return JSONResponse(status_code=status.HTTP_200_OK, content={"status": "alive"})
+
+
+@router.get("/ready")
+async def ready():
+    """
+    Readiness probe: the model is loaded and warmed up.
+
+    Returns:
+        JSONResponse: The model state (see `ModelLoader.state`) with
+        a status code of 200 when ready, 503 otherwise.
     """
     return JSONResponse(
-        status_code=status.HTTP_200_OK, content=embedder.answer(user_text)
+        status_code=(
+            status.HTTP_200_OK
+            if model.ready
+            else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+        content=model.state(),
     )